@@ -0,0 +1,50 @@
+"""
+Gunicorn config for serving jukebox_backend in production.
+
+    gunicorn -c gunicorn.conf.py
+
+By default this runs threaded sync workers ("gthread") on the WSGI app. Set
+GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker to serve the ASGI app with
+async workers instead. Compare the two with `python manage.py bench_serving`.
+"""
+import multiprocessing
+import os
+
+import decouple
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jukebox_backend.settings_production')
+
+bind = decouple.config('GUNICORN_BIND', default='0.0.0.0:8000')
+
+worker_class = decouple.config('GUNICORN_WORKER_CLASS', default='gthread')
+workers = decouple.config('GUNICORN_WORKERS', default=multiprocessing.cpu_count() * 2 + 1, cast=int)
+threads = decouple.config('GUNICORN_THREADS', default=4, cast=int)  # Per worker, gthread only
+
+if 'uvicorn' in worker_class.lower():
+    wsgi_app = 'jukebox_backend.asgi:application'
+else:
+    wsgi_app = 'jukebox_backend.wsgi:application'
+
+# Load Django once in the master and fork workers from it
+preload_app = True
+
+# Recycle workers periodically to cap memory growth
+max_requests = decouple.config('GUNICORN_MAX_REQUESTS', default=2000, cast=int)
+max_requests_jitter = 200
+
+timeout = 30
+keepalive = 5
+
+# On SIGTERM, workers stop accepting connections and get this long to finish
+# in-flight requests, so a Stripe charge isn't cut off between charging the
+# card and queueing the song
+graceful_timeout = decouple.config('GUNICORN_GRACEFUL_TIMEOUT', default=30, cast=int)
+
+accesslog = '-'
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    # Cancel background track warm-ups that haven't started
+    from music_queue import prefetch
+    prefetch.shutdown()
@@ -0,0 +1,41 @@
+"""
+Lazily created clients for third-party integrations.
+
+The Stripe SDK and the HTTP stack behind Freesound are slow to import, so
+they're loaded on the first request that needs them instead of at worker boot.
+Measure with `python manage.py bench_startup`.
+"""
+import threading
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_stripe = None
+_freesound = None
+
+def get_stripe():
+    """
+    The stripe module, configured with our secret key
+    """
+    global _stripe
+    if _stripe is None:
+        with _lock:
+            if _stripe is None:
+                import stripe
+                stripe.api_key = settings.STRIPE_SECRET_KEY
+                _stripe = stripe
+    return _stripe
+
+
+def get_freesound():
+    """
+    Shared FreesoundService, so its access token is reused across requests
+    (and refreshed when it expires)
+    """
+    global _freesound
+    if _freesound is None:
+        with _lock:
+            if _freesound is None:
+                from venues.freesound_service import FreesoundService
+                _freesound = FreesoundService()
+    return _freesound
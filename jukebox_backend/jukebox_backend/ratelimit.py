@@ -0,0 +1,209 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def drain(states, buckets, now, cost=1):
+    """
+    Refill each (key, capacity, refill_rate) bucket from its (tokens, updated_at)
+    state, then take `cost` from all of them or none. Returns the seconds to wait
+    (0 if allowed) and the new states.
+    """
+    levels = {}
+    wait = 0
+    for key, capacity, refill_rate in buckets:
+        tokens, updated_at = states.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + max(now - updated_at, 0) * refill_rate)
+        levels[key] = tokens
+        if tokens < cost:
+            wait = max(wait, (cost - tokens) / refill_rate)
+
+    return wait, {key: (tokens if wait else tokens - cost, now) for key, tokens in levels.items()}
+
+
+class LocalTokenBucketStore:
+    """
+    In-process token bucket store.
+    Buckets live in this worker's memory, so each worker enforces its own budget.
+    Fine for runserver and tests; production uses CacheTokenBucketStore.
+    Stores only need to implement consume_all().
+    """
+    prune_interval = 60  # Seconds between sweeps for buckets that have refilled
+
+    def __init__(self):
+        self._buckets = {}
+        self._full_at = {}  # When each bucket is back at capacity
+        self._next_prune = 0
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        """
+        Take `cost` tokens from the bucket at `key`.
+        Returns 0 if the request is allowed, otherwise the seconds to wait.
+        """
+        return self.consume_all([(key, capacity, refill_rate)], cost)
+
+    def consume_all(self, buckets, cost=1):
+        """
+        Take `cost` tokens from every (key, capacity, refill_rate) bucket, or from
+        none of them if any is short. Returns 0 if allowed, otherwise the seconds to wait.
+        """
+        now = time.monotonic()
+        with self._lock:
+            wait, states = drain(self._buckets, buckets, now, cost)
+            self._buckets.update(states)
+            for key, capacity, refill_rate in buckets:
+                self._full_at[key] = now + (capacity - states[key][0]) / refill_rate
+            if now >= self._next_prune:
+                self._prune(now)
+            return wait
+
+    def _prune(self, now):
+        # A full bucket is the same as no entry, so one-off clients (and made-up
+        # venue ids) don't stay in memory for the life of the worker
+        for key in [key for key, full_at in self._full_at.items() if full_at <= now]:
+            del self._buckets[key]
+            del self._full_at[key]
+        self._next_prune = now + self.prune_interval
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._full_at.clear()
+
+
+class CacheTokenBucketStore:
+    """
+    Token buckets in the Django cache named by settings.RATE_LIMIT_CACHE, so
+    every worker using the same cache (e.g. Redis) shares one budget.
+    A short-lived lock key per bucket, taken with cache.add(), keeps concurrent
+    workers from both spending the same token.
+    """
+    lock_timeout = 1  # Seconds; frees a bucket if a worker dies holding its lock
+
+    def __init__(self):
+        self.cache = caches[settings.RATE_LIMIT_CACHE]
+
+    def consume_all(self, buckets, cost=1):
+        buckets = [(f"ratelimit:{key}", capacity, refill_rate) for key, capacity, refill_rate in buckets]
+        keys = sorted(key for key, _, _ in buckets)  # Same lock order in every worker
+        with self._locked(keys) as locked:
+            if not locked:
+                # Too contended to update safely; ask the client to come back
+                return self.lock_timeout
+            states = self.cache.get_many(keys)
+            wait, states = drain(states, buckets, time.time(), cost)
+            if not wait:
+                for key, capacity, refill_rate in buckets:
+                    # A bucket left alone until it's full again is the same as no entry
+                    self.cache.set(key, states[key], math.ceil(capacity / refill_rate) + 1)
+            return wait
+
+    @contextmanager
+    def _locked(self, keys):
+        """
+        Hold the lock on every key, or yield False if they aren't all free within lock_timeout
+        """
+        locks = []
+        try:
+            deadline = time.monotonic() + self.lock_timeout
+            for key in keys:
+                lock = f"{key}:lock"
+                while not self.cache.add(lock, 1, self.lock_timeout):
+                    if time.monotonic() > deadline:
+                        yield False
+                        return
+                    time.sleep(0.005)
+                locks.append(lock)
+            yield True
+        finally:
+            self.cache.delete_many(locks)
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = import_string(settings.RATE_LIMIT_STORE)()
+    return _store
+
+
+def get_client_ip(request):
+    """
+    Behind settings.TRUSTED_PROXY_COUNT proxies, the client is the address the
+    outermost one appended to X-Forwarded-For. Earlier entries are client-supplied.
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    if proxies and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',')]
+        if len(hops) >= proxies:
+            return hops[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def get_client_key(request):
+    """
+    Authenticated users are limited per account, everyone else per IP
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{get_client_ip(request)}"
+
+
+def check_rate_limit(request, scope, venue_id=None):
+    """
+    Consume one token from every bucket configured for `scope`.
+    Returns the seconds to wait if any bucket is empty, otherwise 0.
+    Rejected requests take nothing, so they don't use up the client's budget.
+    """
+    limits = settings.RATE_LIMITS.get(scope, {})
+    keys = {'client': get_client_key(request)}
+    if venue_id is not None:
+        keys['venue'] = f"venue:{venue_id}"
+
+    buckets = [
+        (f"{scope}:{key}", limits[bucket]['capacity'], limits[bucket]['refill_rate'])
+        for bucket, key in keys.items()
+        if limits.get(bucket)
+    ]
+    if not buckets:
+        return 0
+    return get_store().consume_all(buckets)
+
+
+def rate_limit(scope):
+    """
+    Reject requests over budget with 429 before the view does any DB or upstream work.
+    `scope` is a key of settings.RATE_LIMITS, or a callable taking the request
+    and returning one (e.g. to give paid and free adds separate budgets).
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not settings.RATE_LIMIT_ENABLED:
+                return view_func(request, *args, **kwargs)
+
+            resolved_scope = scope(request) if callable(scope) else scope
+            retry_after = check_rate_limit(request, resolved_scope, kwargs.get('venue_id'))
+            if retry_after:
+                retry_after = math.ceil(retry_after)
+                return Response({
+                    'error': 'Too many requests. Please try again later.',
+                    'retry_after': retry_after
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(retry_after)})
+
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,105 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Optional speedups: fall back to the stock renderers when not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer backed by orjson.
+    Types orjson doesn't handle natively (and datetimes, to keep DRF's
+    formatting) go through DRF's JSONEncoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b''
+
+        return orjson.dumps(
+            data,
+            default=_encoder.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+
+
+def to_columnar(data):
+    """
+    Rewrite lists of objects as {'columns': [...], 'rows': [[...], ...]} so keys
+    aren't repeated per item. Nested objects are flattened into dotted column names.
+    Empty lists become an empty table, so clients see the same shape for an empty queue.
+    """
+    if isinstance(data, dict):
+        return {key: to_columnar(value) for key, value in data.items()}
+
+    if isinstance(data, (list, tuple)):
+        if all(isinstance(item, dict) for item in data):
+            flat_items = [_flatten(item) for item in data]
+            columns = {}
+            for item in flat_items:
+                columns.update(dict.fromkeys(item))
+            return {
+                'columns': list(columns),
+                'rows': [[item.get(column) for column in columns] for item in flat_items],
+            }
+        return [to_columnar(item) for item in data]
+
+    return data
+
+
+def _flatten(item, prefix=''):
+    flat = {}
+    for key, value in item.items():
+        name = prefix + key if prefix else key
+        if isinstance(value, dict) and value:
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (list, tuple)):
+            flat[name] = to_columnar(value)
+        else:
+            flat[name] = value
+    return flat
+
+
+class ColumnarJSONRenderer(ORJSONRenderer):
+    """
+    Compact JSON: lists of objects are sent as column names plus row arrays
+    """
+    media_type = 'application/vnd.jukebox.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(to_columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Binary MessagePack responses (requires the msgpack package)
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
+
+
+# Renderers for hot endpoints; clients opt into compact formats via Accept
+COMPACT_RENDERER_CLASSES = [ORJSONRenderer, ColumnarJSONRenderer]
+if msgpack is not None:
+    COMPACT_RENDERER_CLASSES.append(MessagePackRenderer)
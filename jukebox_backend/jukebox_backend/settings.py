@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -86,6 +86,22 @@ DATABASES = {
     }
 }
 
+# Venue sharding for queue data (see music_queue/sharding.py)
+# Aliases holding queue rows (QueueItem, QueuePayment, CurrentlyPlaying). New venues
+# go to the least used one and keep it, so only append shards, never remove them.
+QUEUE_SHARDS = config('QUEUE_SHARDS', default='default', cast=Csv())
+
+# Shards without their own DATABASES entry get a local SQLite file, e.g. QUEUE_SHARDS=default,shard1
+# (development and tests only; settings_production.py refuses them)
+LOCAL_SHARD_DATABASES = [shard for shard in QUEUE_SHARDS if shard not in DATABASES]
+for shard in LOCAL_SHARD_DATABASES:
+    DATABASES[shard] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'{shard}.sqlite3',
+    }
+
+DATABASE_ROUTERS = ['music_queue.sharding.QueueShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -134,7 +150,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'jukebox_backend.renderers.ORJSONRenderer',  # Falls back to JSONRenderer without orjson
     ]
 }
 
@@ -150,12 +166,49 @@ CORS_ALLOW_ALL_ORIGINS = True  # For development only
 FREESOUND_API_BASE_URL = "https://freesound.org/apiv2"
 FREESOUND_CLIENT_ID = config('FREESOUND_CLIENT_ID', default='')
 FREESOUND_CLIENT_SECRET = config('FREESOUND_CLIENT_SECRET', default='')
+FREESOUND_CACHE_TIMEOUT = 60 * 60 * 6  # seconds to cache sound details and preview URLs
+
+# Preview audio cache (see venues/preview_cache.py)
+PREVIEW_CACHE_DIR = config('PREVIEW_CACHE_DIR', default=str(BASE_DIR / 'preview_cache'))
+PREVIEW_CACHE_MAX_BYTES = config('PREVIEW_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)  # Total for the directory, across all workers
+PREVIEW_FETCH_TIMEOUT = config('PREVIEW_FETCH_TIMEOUT', default=10, cast=int)  # seconds
+
+# Upcoming track prefetch (see music_queue/prefetch.py)
+PREFETCH_ENABLED = config('PREFETCH_ENABLED', default=True, cast=bool)
+PREFETCH_UPCOMING_COUNT = 3  # Queued items to warm ahead of the player
+PREFETCH_WORKERS = 4
 
 # Stripe settings
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
+STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
 
 # Firebase settings
 FIREBASE_API_KEY = config('FIREBASE_API_KEY', default='')
 FIREBASE_AUTH_DOMAIN = config('FIREBASE_AUTH_DOMAIN', default='')
 FIREBASE_PROJECT_ID = config('FIREBASE_PROJECT_ID', default='')
+
+# Rate limiting (token buckets, see jukebox_backend/ratelimit.py)
+# capacity = burst size, refill_rate = tokens added per second
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_STORE = 'jukebox_backend.ratelimit.LocalTokenBucketStore'
+RATE_LIMIT_CACHE = 'default'  # Used by CacheTokenBucketStore
+# Reverse proxies in front of the app; anonymous clients are keyed by the
+# X-Forwarded-For hop the outermost one added (0 = use REMOTE_ADDR)
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', default=0, cast=int)
+RATE_LIMITS = {
+    'search': {
+        'client': {'capacity': 20, 'refill_rate': 0.5},
+    },
+    'preview_fetch': {  # Preview cache misses only; hits and Range requests are free
+        'client': {'capacity': 10, 'refill_rate': 0.2},
+    },
+    'queue_add_free': {
+        'client': {'capacity': 3, 'refill_rate': 1 / 60},
+        'venue': {'capacity': 60, 'refill_rate': 0.5},
+    },
+    'queue_add_paid': {
+        'client': {'capacity': 10, 'refill_rate': 1 / 6},
+        'venue': {'capacity': 120, 'refill_rate': 1},
+    },
+}
@@ -0,0 +1,87 @@
+"""
+Production settings for jukebox_backend.
+
+Extends settings.py with DEBUG off (which also stops Django recording every
+SQL query in memory), required secrets, persistent DB connections, a Redis
+cache shared by the workers and static files served by WhiteNoise.
+gunicorn.conf.py selects this module by default.
+"""
+
+import logging
+
+from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, CORS_ALLOWED_ORIGINS, DATABASES, LOCAL_SHARD_DATABASES, MIDDLEWARE, RATE_LIMIT_ENABLED
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = config('SECRET_KEY')
+
+DEBUG = False
+
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='', cast=Csv())
+
+CORS_ALLOW_ALL_ORIGINS = False
+CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default=','.join(CORS_ALLOWED_ORIGINS), cast=Csv())
+
+# Every queue shard needs a real database; a typo in QUEUE_SHARDS would
+# otherwise write queue rows to a SQLite file on each host's local disk
+if LOCAL_SHARD_DATABASES:
+    raise ImproperlyConfigured(
+        f"QUEUE_SHARDS lists {', '.join(LOCAL_SHARD_DATABASES)} without a DATABASES entry; "
+        "add one for each shard here"
+    )
+
+# Keep database connections open between requests instead of reconnecting each time
+# (on every queue shard too)
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = config('CONN_MAX_AGE', default=60, cast=int)
+    database['CONN_HEALTH_CHECKS'] = True
+
+# Cache shared by all gunicorn workers (and kept across max_requests restarts),
+# so rate limits hold per deployment rather than per worker, and workers reuse
+# one Freesound token. Needs the redis package.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+elif RATE_LIMIT_ENABLED:
+    raise ImproperlyConfigured(
+        'Set REDIS_URL so gunicorn workers share rate limits '
+        '(or RATE_LIMIT_ENABLED=False to serve without them)'
+    )
+RATE_LIMIT_STORE = 'jukebox_backend.ratelimit.CacheTokenBucketStore'
+
+# Static files, collected with `python manage.py collectstatic`
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Serve static files from the app workers if WhiteNoise is installed
+try:
+    import whitenoise  # noqa: F401
+except ImportError:
+    logging.getLogger(__name__).warning(
+        'WhiteNoise is not installed, so static files (e.g. the admin) are only '
+        'served if something in front of the app serves STATIC_ROOT'
+    )
+else:
+    security_index = MIDDLEWARE.index('django.middleware.security.SecurityMiddleware')
+    MIDDLEWARE = MIDDLEWARE[:security_index + 1] + ['whitenoise.middleware.WhiteNoiseMiddleware'] + MIDDLEWARE[security_index + 1:]
+    STORAGES = {
+        'default': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        },
+        'staticfiles': {
+            'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+        },
+    }
+
+# Behind a TLS-terminating proxy
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', default=1, cast=int)  # Rate limit by client, not proxy IP
+SESSION_COOKIE_SECURE = config('SESSION_COOKIE_SECURE', default=True, cast=bool)
+CSRF_COOKIE_SECURE = config('CSRF_COOKIE_SECURE', default=True, cast=bool)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MusicQueueConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'music_queue'
+
+    def ready(self):
+        from . import signals  # noqa: F401
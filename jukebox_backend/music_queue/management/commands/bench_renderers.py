@@ -0,0 +1,104 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from jukebox_backend.renderers import ORJSONRenderer, ColumnarJSONRenderer, MessagePackRenderer, msgpack, orjson
+from music_queue.models import QueueItem, CurrentlyPlaying
+from music_queue.serializers import QueueItemSerializer, CurrentlyPlayingSerializer
+from venues.freesound_service import FreesoundService
+from venues.models import Venue, Song
+
+class Command(BaseCommand):
+    help = 'Benchmark response renderers on venue_queue and search_songs payloads (no database needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=2000,
+            help='Renders per renderer and payload (default: 2000)'
+        )
+        parser.add_argument(
+            '--queue-size',
+            type=int,
+            default=10,
+            help='Queue items in the venue_queue payload (default: 10)'
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        renderers = [('JSONRenderer (stock)', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('ORJSONRenderer', ORJSONRenderer()))
+        else:
+            self.stdout.write(self.style.WARNING('orjson not installed, ORJSONRenderer falls back to stock JSON'))
+        renderers.append(('ColumnarJSONRenderer', ColumnarJSONRenderer()))
+        if msgpack is not None:
+            renderers.append(('MessagePackRenderer', MessagePackRenderer()))
+        else:
+            self.stdout.write(self.style.WARNING('msgpack not installed, skipping MessagePackRenderer'))
+
+        payloads = [
+            ('venue_queue', self._queue_payload(options['queue_size'])),
+            ('search_songs', self._search_payload()),
+        ]
+
+        for payload_name, payload in payloads:
+            self.stdout.write(f'\n{payload_name} ({iterations} renders)')
+            baseline = None
+            for renderer_name, renderer in renderers:
+                body = renderer.render(payload)
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    renderer.render(payload)
+                per_render_us = (time.perf_counter() - start) / iterations * 1_000_000
+
+                if baseline is None:
+                    baseline = (per_render_us, len(body))
+                self.stdout.write(
+                    f'  {renderer_name:<22} {per_render_us:8.1f} us/render '
+                    f'({baseline[0] / per_render_us:4.1f}x)  '
+                    f'{len(body):7d} bytes ({len(body) / baseline[1]:4.0%})'
+                )
+
+    def _queue_payload(self, queue_size):
+        """
+        Same shape as the venue_queue response, built from unsaved model instances
+        """
+        now = timezone.now()
+        venue = Venue(id=1, name='L&L Hawaiian BBQ', description='Authentic Hawaiian BBQ with island vibes', created_at=now)
+        items = []
+        for i in range(queue_size + 1):
+            song = Song(
+                id=i + 1,
+                title=f'Sample Track {i}',
+                artist=f'Artist {i}',
+                duration=180 + i * 15,
+                external_id=str(100000 + i),
+                album_art_url='https://cdn.freesound.org/displays/100/100000_wave_M.png',
+                created_at=now
+            )
+            items.append(QueueItem(
+                id=i + 1,
+                venue=venue,
+                song=song,
+                is_paid=i % 3 == 0,
+                amount_paid=Decimal('1.00') if i % 3 == 0 else Decimal('0.00'),
+                queued_at=now
+            ))
+
+        currently_playing = CurrentlyPlaying(venue=venue, queue_item=items[0], started_at=now)
+        return {
+            'venue_id': venue.id,
+            'venue_name': venue.name,
+            'currently_playing': CurrentlyPlayingSerializer(currently_playing).data,
+            'queue': QueueItemSerializer(items[1:], many=True).data
+        }
+
+    def _search_payload(self):
+        payload = FreesoundService()._mock_response('ambient')
+        payload['results'] = payload['results'] * 3  # Default page size is 15
+        return payload
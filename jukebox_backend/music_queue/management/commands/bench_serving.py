@@ -0,0 +1,152 @@
+import http.client
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from venues.models import Venue
+
+DEFAULT_WORKER_CLASSES = ['gthread', 'uvicorn_worker.UvicornWorker']
+
+class Command(BaseCommand):
+    help = 'Compare request throughput of gunicorn worker classes using gunicorn.conf.py'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--worker-class',
+            action='append',
+            dest='worker_classes',
+            help=f'Worker class to benchmark, can be repeated (default: {", ".join(DEFAULT_WORKER_CLASSES)})'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Gunicorn worker processes (default: 2)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=16,
+            help='Concurrent client connections (default: 16)'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10,
+            help='Seconds of load per worker class (default: 10)'
+        )
+        parser.add_argument(
+            '--path',
+            type=str,
+            help='Path to request (default: the first venue\'s queue)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            venue = Venue.objects.first()
+            if venue is None:
+                raise CommandError('No venues found, run seed_venues first or pass --path')
+            path = f'/api/venues/{venue.id}/queue/'
+
+        self.stdout.write(f'GET {path}, {options["workers"]} workers, {options["concurrency"]} connections, {options["duration"]:.0f}s each')
+        for worker_class in options['worker_classes'] or DEFAULT_WORKER_CLASSES:
+            port = self._free_port()
+            server = self._start_server(worker_class, options['workers'], port)
+            try:
+                self._wait_until_ready(server, port, path)
+                results = self._load(port, path, options['concurrency'], options['duration'])
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+
+            latencies = sorted(results['latencies'])
+            if not latencies:
+                self.stdout.write(self.style.ERROR(f'  {worker_class}: no successful requests ({results["errors"]} errors)'))
+                continue
+            self.stdout.write(
+                f'  {worker_class:<32} {len(latencies) / options["duration"]:8.1f} req/s   '
+                f'p50 {statistics.median(latencies) * 1000:6.1f} ms   '
+                f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:6.1f} ms   '
+                f'errors {results["errors"]}'
+            )
+
+    def _free_port(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def _start_server(self, worker_class, workers, port):
+        env = dict(
+            os.environ,
+            GUNICORN_WORKER_CLASS=worker_class,
+            GUNICORN_WORKERS=str(workers),
+            GUNICORN_BIND=f'127.0.0.1:{port}',
+            ALLOWED_HOSTS='127.0.0.1,localhost',
+            SECRET_KEY=os.environ.get('SECRET_KEY', settings.SECRET_KEY),
+            # One client hammering one endpoint; limits would only measure the 429 path
+            RATE_LIMIT_ENABLED='False',
+        )
+        return subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--access-logfile', '/dev/null'],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def _wait_until_ready(self, server, port, path, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('Gunicorn exited during startup, run it by hand to see the error')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+                connection.request('GET', path)
+                connection.getresponse().read()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('Gunicorn did not start in time')
+
+    def _load(self, port, path, concurrency, duration):
+        results = {'latencies': [], 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client():
+            latencies = []
+            errors = 0
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    connection.request('GET', path)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status == 200:
+                        latencies.append(time.perf_counter() - start)
+                    else:
+                        errors += 1
+                except (OSError, http.client.HTTPException):
+                    errors += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            connection.close()
+            with lock:
+                results['latencies'].extend(latencies)
+                results['errors'] += errors
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
@@ -0,0 +1,87 @@
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# What a worker does at boot: load the WSGI app and resolve the URLconf (imports every view)
+BOOT_SCRIPT = """
+import os
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jukebox_backend.settings')
+import jukebox_backend.wsgi
+from django.urls import get_resolver
+get_resolver().url_patterns
+"""
+
+# Integrations that should only be imported on first use
+# (requests isn't listed: Django REST framework imports it at boot anyway)
+WATCHED_MODULES = ['stripe', 'venues.freesound_service', 'venues.preview_cache']
+
+class Command(BaseCommand):
+    help = 'Profile worker boot with -X importtime and report startup time and heavy imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Fresh interpreter boots to time (default: 5)'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Slowest top-level imports to list (default: 15)'
+        )
+
+    def handle(self, *args, **options):
+        wall_times = []
+        import_totals = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+            )
+            wall_times.append(time.perf_counter() - start)
+
+            if result.returncode != 0:
+                self.stderr.write(result.stderr)
+                return
+
+            imports = self._parse_importtime(result.stderr)
+            import_totals.append(sum(cumulative for name, cumulative, depth in imports if depth == 0))
+
+        self.stdout.write(f'Worker boot over {options["runs"]} runs:')
+        self.stdout.write(f'  wall time    median {statistics.median(wall_times) * 1000:7.1f} ms   min {min(wall_times) * 1000:7.1f} ms')
+        self.stdout.write(f'  import time  median {statistics.median(import_totals) / 1000:7.1f} ms   min {min(import_totals) / 1000:7.1f} ms')
+
+        self.stdout.write('\nSlowest top-level imports (last run):')
+        top_level = sorted((item for item in imports if item[2] == 0), key=lambda item: -item[1])
+        for name, cumulative, depth in top_level[:options['top']]:
+            self.stdout.write(f'  {cumulative / 1000:7.1f} ms  {name}')
+
+        self.stdout.write('\nIntegrations loaded at boot:')
+        imported = {name: cumulative for name, cumulative, depth in imports}
+        for module in WATCHED_MODULES:
+            if module in imported:
+                self.stdout.write(self.style.WARNING(f'  {module}: imported ({imported[module] / 1000:.1f} ms)'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'  {module}: not imported'))
+
+    def _parse_importtime(self, output):
+        """
+        Returns (module, cumulative microseconds, nesting depth) for each -X importtime line
+        """
+        imports = []
+        for line in output.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            imports.append((name.strip(), int(cumulative), depth))
+        return imports
@@ -0,0 +1,149 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from jukebox_backend.integrations import get_stripe
+from music_queue.models import QueueItem, QueuePayment
+from music_queue.sharding import queue_shards
+
+LOOKUP_BATCH_SIZE = 1000
+
+class Command(BaseCommand):
+    help = 'Reconcile paid queue items against Stripe charges over a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=str,
+            help='First day to reconcile, YYYY-MM-DD (default: 30 days ago)'
+        )
+        parser.add_argument(
+            '--end',
+            type=str,
+            help='Last day to reconcile, YYYY-MM-DD (default: today)'
+        )
+        parser.add_argument(
+            '--api-base',
+            type=str,
+            help='Stripe API base URL, e.g. http://localhost:12111 for a local stripe-mock'
+        )
+
+    def handle(self, *args, **options):
+        start, end = self._date_range(options)
+
+        if options['api_base']:
+            get_stripe().api_base = options['api_base']
+
+        self.stdout.write(f'Reconciling payments from {start:%Y-%m-%d} to {end - timedelta(days=1):%Y-%m-%d}')
+
+        charged = self._fetch_charges(start, end)
+        self.stdout.write(f'Fetched succeeded charges for {len(charged)} payment intents')
+
+        mismatches = 0
+        matched = 0
+        seen_intent_ids = set()
+
+        # Join charges to recorded payments in batches through the payment intent index
+        intent_ids = list(charged)
+        # Payments are spread over shards, so each batch is looked up on every one
+        for i in range(0, len(intent_ids), LOOKUP_BATCH_SIZE):
+            batch = intent_ids[i:i + LOOKUP_BATCH_SIZE]
+            for shard in queue_shards():
+                payments = QueuePayment.objects.using(shard).filter(stripe_payment_intent_id__in=batch).only(
+                    'queue_item_id', 'amount', 'status', 'stripe_payment_intent_id'
+                )
+                for payment in payments:
+                    seen_intent_ids.add(payment.stripe_payment_intent_id)
+                    amount, charge_ids = charged[payment.stripe_payment_intent_id]
+                    label = self._item_label(payment.queue_item_id, shard)
+
+                    if payment.status != 'succeeded':
+                        mismatches += 1
+                        self._flag(f'{label} is {payment.status} but Stripe charged {amount} ({", ".join(charge_ids)})')
+                    elif payment.amount != amount:
+                        mismatches += 1
+                        self._flag(f'{label} recorded {payment.amount} but Stripe charged {amount} ({", ".join(charge_ids)})')
+                    else:
+                        matched += 1
+
+        for intent_id in intent_ids:
+            if intent_id not in seen_intent_ids:
+                mismatches += 1
+                amount, charge_ids = charged[intent_id]
+                self._flag(f'Charge {", ".join(charge_ids)} for {amount} ({intent_id}) has no queue item')
+
+        # Paid items in the range that Stripe has no successful charge for
+        unverifiable = 0
+        for shard in queue_shards():
+            paid = QueuePayment.objects.using(shard).filter(
+                status='succeeded',
+                created_at__gte=start,
+                created_at__lt=end
+            ).values_list('queue_item_id', 'stripe_payment_intent_id', 'amount')
+
+            for item_id, intent_id, amount in paid.iterator():
+                if intent_id not in charged:
+                    mismatches += 1
+                    self._flag(f'{self._item_label(item_id, shard)} recorded {amount} paid but Stripe has no charge for {intent_id}')
+
+            # Demo payments never reach Stripe
+            unverifiable += QueueItem.objects.using(shard).filter(
+                payment_status='succeeded',
+                queued_at__gte=start,
+                queued_at__lt=end,
+                payments__isnull=True
+            ).count()
+
+        self.stdout.write(f'Matched: {matched}')
+        if unverifiable:
+            self.stdout.write(f'Without payment intent (demo payments): {unverifiable}')
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'Mismatches: {mismatches}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No mismatches found'))
+
+    def _date_range(self, options):
+        """
+        Aware datetimes covering whole days, end exclusive
+        """
+        try:
+            end_day = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else timezone.now().date()
+            start_day = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] else end_day - timedelta(days=30)
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+
+        if start_day > end_day:
+            raise CommandError('--start must not be after --end')
+
+        start = datetime.combine(start_day, time.min, tzinfo=dt_timezone.utc)
+        end = datetime.combine(end_day + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+        return start, end
+
+    def _fetch_charges(self, start, end):
+        """
+        Page through succeeded charges in the range.
+        Returns {payment_intent_id: (net amount in dollars, [charge ids])}
+        """
+        charged = {}
+        charges = get_stripe().Charge.list(
+            created={'gte': int(start.timestamp()), 'lt': int(end.timestamp())},
+            limit=100
+        )
+        for charge in charges.auto_paging_iter():
+            if charge['status'] != 'succeeded' or not charge.get('payment_intent'):
+                continue
+
+            amount = Decimal(charge['amount'] - charge.get('amount_refunded', 0)) / 100
+            total, charge_ids = charged.get(charge['payment_intent'], (Decimal('0.00'), []))
+            charged[charge['payment_intent']] = (total + amount, charge_ids + [charge['id']])
+        return charged
+
+    def _item_label(self, item_id, shard):
+        # Item ids are only unique within a shard
+        if len(queue_shards()) > 1:
+            return f'Queue item {item_id} on {shard}'
+        return f'Queue item {item_id}'
+
+    def _flag(self, message):
+        self.stdout.write(self.style.WARNING(f'  MISMATCH: {message}'))
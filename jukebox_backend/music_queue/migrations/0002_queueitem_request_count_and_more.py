@@ -0,0 +1,25 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_queue', '0001_initial'),
+        ('venues', '0002_venue_dedupe_requests'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queueitem',
+            name='request_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='queueitem',
+            index=models.Index(fields=['venue', 'song', 'status'], name='music_queue_venue_i_201a7b_idx'),
+        ),
+    ]
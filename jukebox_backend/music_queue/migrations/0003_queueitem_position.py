@@ -0,0 +1,44 @@
+# Generated by Django 4.2.23 on 2026-10-19 17:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_positions(apps, schema_editor):
+    """
+    Rank existing items by queued_at, matching the previous queue order
+    """
+    from music_queue.ranking import timestamp_rank
+    
+    QueueItem = apps.get_model('music_queue', 'QueueItem')
+    db_alias = schema_editor.connection.alias
+    items = list(QueueItem.objects.using(db_alias).only('id', 'queued_at'))
+    for item in items:
+        item.position = timestamp_rank(item.queued_at)
+    QueueItem.objects.using(db_alias).bulk_update(items, ['position'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_queue', '0002_queueitem_request_count_and_more'),
+        ('venues', '0002_venue_dedupe_requests'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='queueitem',
+            options={'ordering': ['-is_paid', 'position']},
+        ),
+        migrations.AddField(
+            model_name='queueitem',
+            name='position',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(populate_positions, migrations.RunPython.noop, hints={'model_name': 'queueitem'}),
+        migrations.AddIndex(
+            model_name='queueitem',
+            index=models.Index(fields=['venue', 'status', 'is_paid', 'position'], name='music_queue_venue_i_e0fb7c_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.23 on 2026-10-19 17:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_paid_items_succeeded(apps, schema_editor):
+    QueueItem = apps.get_model('music_queue', 'QueueItem')
+    QueueItem.objects.using(schema_editor.connection.alias).filter(is_paid=True).update(payment_status='succeeded')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_queue', '0003_queueitem_position'),
+        ('venues', '0002_venue_dedupe_requests'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('event_type', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='queueitem',
+            name='payment_status',
+            field=models.CharField(choices=[('free', 'Free'), ('pending', 'Pending'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='free', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='queueitem',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Awaiting payment'), ('queued', 'Queued'), ('playing', 'Playing'), ('played', 'Played'), ('skipped', 'Skipped'), ('cancelled', 'Cancelled')], default='queued', max_length=10),
+        ),
+        migrations.RunPython(mark_paid_items_succeeded, migrations.RunPython.noop, hints={'model_name': 'queueitem'}),
+        migrations.CreateModel(
+            name='QueuePayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_payment_intent_id', models.CharField(max_length=255, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('queue_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='music_queue.queueitem')),
+                ('venue', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='venues.venue')),
+            ],
+        ),
+    ]
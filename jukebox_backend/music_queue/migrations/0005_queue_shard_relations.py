@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2026-10-19 17:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_queue', '0004_stripe_webhook_payments'),
+        ('venues', '0002_venue_dedupe_requests'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='currentlyplaying',
+            name='venue',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='venues.venue'),
+        ),
+        migrations.AlterField(
+            model_name='queueitem',
+            name='song',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='venues.song'),
+        ),
+        migrations.AlterField(
+            model_name='queueitem',
+            name='user',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='queueitem',
+            name='venue',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='venues.venue'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.23 on 2026-10-19 17:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music_queue', '0005_queue_shard_relations'),
+        ('venues', '0003_venue_queue_shard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queueitem',
+            name='dedupe',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name='queueitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('dedupe', True), ('status', 'queued')), fields=('venue', 'song'), name='unique_deduped_queued_song'),
+        ),
+    ]
@@ -1,36 +1,124 @@
 from django.db import models
 from django.contrib.auth.models import User
 from venues.models import Venue, Song
+from .ranking import rank_after
+from .sharding import VenueShardManager
 
 class QueueItem(models.Model):
     QUEUE_STATUS_CHOICES = [
+        ('pending', 'Awaiting payment'),  # Held out of the queue until the webhook confirms payment
         ('queued', 'Queued'),
         ('playing', 'Playing'),
         ('played', 'Played'),
         ('skipped', 'Skipped'),
+        ('cancelled', 'Cancelled'),  # Payment failed or was abandoned
     ]
     
-    venue = models.ForeignKey(Venue, on_delete=models.CASCADE)
-    song = models.ForeignKey(Song, on_delete=models.CASCADE)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    PAYMENT_STATUS_CHOICES = [
+        ('free', 'Free'),
+        ('pending', 'Pending'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    # Venue, song and user live on 'default' while queue rows may be on a shard,
+    # so these can't be enforced by the database. Deletes cascade through
+    # music_queue/signals.py instead, on every shard.
+    venue = models.ForeignKey(Venue, on_delete=models.DO_NOTHING, db_constraint=False)
+    song = models.ForeignKey(Song, on_delete=models.DO_NOTHING, db_constraint=False)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False)
     is_paid = models.BooleanField(default=False)
     amount_paid = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
+    payment_status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='free')
     status = models.CharField(max_length=10, choices=QUEUE_STATUS_CHOICES, default='queued')
+    request_count = models.PositiveIntegerField(default=1)  # Merged repeat requests when venue dedupes
+    dedupe = models.BooleanField(default=False)  # Queued while the venue dedupes; at most one per song
+    position = models.CharField(max_length=255, blank=True, default='')  # Lexicographic rank within paid/free tier
     queued_at = models.DateTimeField(auto_now_add=True)
     played_at = models.DateTimeField(null=True, blank=True)
     
+    objects = VenueShardManager()
+    
     class Meta:
-        ordering = ['-is_paid', 'queued_at']  # Paid songs first, then by time
+        ordering = ['-is_paid', 'position']  # Paid songs first, then by rank
+        indexes = [
+            models.Index(fields=['venue', 'song', 'status']),  # Dedupe lookup
+            models.Index(fields=['venue', 'status', 'is_paid', 'position']),  # Queue order
+        ]
+        constraints = [
+            # Backstop for concurrent adds that both miss the dedupe lookup
+            models.UniqueConstraint(
+                fields=['venue', 'song'],
+                condition=models.Q(status='queued', dedupe=True),
+                name='unique_deduped_queued_song',
+            ),
+        ]
+    
+    @classmethod
+    def tail_position(cls, venue, is_paid):
+        """
+        Rank that places an item at the end of its tier in the venue's queue
+        """
+        last_position = cls.objects.for_venue(venue).filter(
+            status='queued',
+            is_paid=is_paid
+        ).order_by('-position').values_list('position', flat=True).first()
+        return rank_after(last_position)
+    
+    def save(self, *args, **kwargs):
+        if not self.position:
+            self.position = QueueItem.tail_position(self.venue, self.is_paid)
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.song.title} at {self.venue.name} ({'Paid' if self.is_paid else 'Free'})"
 
 class CurrentlyPlaying(models.Model):
-    venue = models.OneToOneField(Venue, on_delete=models.CASCADE)
+    venue = models.OneToOneField(Venue, on_delete=models.DO_NOTHING, db_constraint=False)
     queue_item = models.ForeignKey(QueueItem, on_delete=models.CASCADE, null=True, blank=True)
     started_at = models.DateTimeField(auto_now=True)
     
+    objects = VenueShardManager()
+    
     def __str__(self):
         if self.queue_item:
             return f"Playing {self.queue_item.song.title} at {self.venue.name}"
         return f"Nothing playing at {self.venue.name}"
+
+
+class QueuePayment(models.Model):
+    """
+    A Stripe PaymentIntent paid towards a queue item. Merged repeat requests
+    can put several payments on one item.
+    """
+    PAYMENT_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    venue = models.ForeignKey(Venue, on_delete=models.DO_NOTHING, db_constraint=False)  # Picks the shard
+    queue_item = models.ForeignKey(QueueItem, on_delete=models.CASCADE, related_name='payments')
+    stripe_payment_intent_id = models.CharField(max_length=255, unique=True)
+    amount = models.DecimalField(max_digits=5, decimal_places=2)
+    status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = VenueShardManager()
+    
+    def __str__(self):
+        return f"{self.stripe_payment_intent_id} for queue item {self.queue_item_id} ({self.status})"
+
+
+class StripeEvent(models.Model):
+    """
+    Stripe webhook events we've received, so redelivered events are only handled once
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id})"
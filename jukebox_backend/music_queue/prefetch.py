@@ -0,0 +1,91 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from jukebox_backend.integrations import get_freesound
+from .models import QueueItem
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()  # Sound ids currently being warmed
+_in_flight_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PREFETCH_WORKERS,
+                thread_name_prefix='prefetch'
+            )
+    return _executor
+
+
+def shutdown():
+    """
+    Drop queued warm-ups and stop the pool; called when a worker exits
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def upcoming_items(venue, count=None):
+    """
+    Next queued items for a venue in play order
+    """
+    count = count or settings.PREFETCH_UPCOMING_COUNT
+    # Songs and venues may be on another database than the queue, so no select_related
+    return QueueItem.objects.for_venue(venue).filter(
+        status='queued'
+    ).prefetch_related('song', 'venue').order_by('-is_paid', 'position')[:count]
+
+
+def warm_sound(sound_id):
+    """
+    Load sound details and the preview file into their caches
+    """
+    from venues.preview_cache import get_preview_cache
+
+    try:
+        freesound = get_freesound()
+        if not freesound.client_id:
+            return
+        freesound.get_sound_details(sound_id)
+        get_preview_cache().get_or_fetch(sound_id, freesound.get_preview_url)
+    except Exception as e:
+        logger.error(f"Error warming sound {sound_id}: {e}")
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(sound_id)
+
+
+def warm_upcoming(venue, items=None):
+    """
+    Warm the next items at a venue in the background so track changes don't start cold.
+    Sounds already being warmed are skipped.
+    """
+    if not settings.PREFETCH_ENABLED:
+        return
+
+    from venues.freesound_service import freesound_sound_id
+
+    if items is None:
+        items = upcoming_items(venue)
+
+    for item in items:
+        sound_id = freesound_sound_id(item.song.external_id)
+        if not sound_id:
+            continue
+
+        with _in_flight_lock:
+            if sound_id in _in_flight:
+                continue
+            _in_flight.add(sound_id)
+
+        get_executor().submit(warm_sound, sound_id)
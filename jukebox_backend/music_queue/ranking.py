@@ -0,0 +1,81 @@
+"""
+Lexicographic ranks for ordering queue items.
+
+Each QueueItem stores a string position; the queue is sorted by it within the
+paid and free tiers. A new rank can always be generated between any two
+existing ones, so moving an item only rewrites that item's row.
+
+Ranks use lowercase base-36 digits (sorts the same under any common collation)
+and never end in '0', which guarantees there is always room before a rank.
+"""
+from django.utils import timezone
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+TIMESTAMP_WIDTH = 11  # 36**11 microseconds is several thousand years
+
+def timestamp_rank(moment=None):
+    """
+    Fixed-width rank from a timestamp, so appends keep ranks short
+    """
+    moment = moment or timezone.now()
+    return _encode_micros(int(moment.timestamp() * 1_000_000))
+
+
+def _encode_micros(value):
+    digits = []
+    while value:
+        value, remainder = divmod(value, BASE)
+        digits.append(DIGITS[remainder])
+    encoded = ''.join(reversed(digits)).rjust(TIMESTAMP_WIDTH, '0')
+    return encoded + DIGITS[BASE // 2]  # Never end in '0'
+
+
+def rank_between(before=None, after=None):
+    """
+    Return a rank strictly between `before` and `after`.
+    None means unbounded on that side.
+    """
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"Cannot rank between {before!r} and {after!r}")
+
+    before = before or ''
+    rank = []
+    i = 0
+    while True:
+        low = DIGITS.index(before[i]) if i < len(before) else 0
+        high = DIGITS.index(after[i]) if after is not None and i < len(after) else BASE
+
+        if high - low > 1:
+            rank.append(DIGITS[(low + high) // 2])
+            return ''.join(rank)
+
+        rank.append(DIGITS[low])
+        if high - low == 1:
+            # Already below `after` from here on
+            after = None
+        i += 1
+
+
+def rank_after(last=None, moment=None):
+    """
+    Rank for appending after `last`. Uses the current time while that sorts
+    later, so ranks stay fixed-width for normal appends.
+    """
+    rank = timestamp_rank(moment)
+    if last is None or rank > last:
+        return rank
+    return rank_between(last, None)
+
+
+def spread_ranks(count, start, end=None):
+    """
+    `count` ascending timestamp ranks spread evenly between the `start` and `end`
+    (default now) datetimes, for re-ranking a tier whose ranks have collided.
+    They stay fixed-width and no later than now, so appends after them go back
+    to plain timestamp ranks.
+    """
+    high = int((end or timezone.now()).timestamp() * 1_000_000)
+    low = min(int(start.timestamp() * 1_000_000), high - count)
+    step = (high - low) // count
+    return [_encode_micros(low + step * i) for i in range(1, count + 1)]
@@ -8,7 +8,7 @@ class QueueItemSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = QueueItem
-        fields = ['id', 'venue', 'song', 'is_paid', 'amount_paid', 'status', 'queued_at', 'played_at']
+        fields = ['id', 'venue', 'song', 'is_paid', 'amount_paid', 'payment_status', 'request_count', 'status', 'queued_at', 'played_at']
 
 class CurrentlyPlayingSerializer(serializers.ModelSerializer):
     venue = VenueSerializer(read_only=True)
@@ -25,4 +25,7 @@ class AddToQueueSerializer(serializers.Serializer):
     duration = serializers.IntegerField()
     album_art_url = serializers.URLField(required=False)
     is_paid = serializers.BooleanField(default=False)
-    payment_method_id = serializers.CharField(max_length=255, required=False)  # Stripe payment method ID
\ No newline at end of file
+    payment_method_id = serializers.CharField(max_length=255, required=False)  # Stripe payment method ID
+
+class MoveQueueItemSerializer(serializers.Serializer):
+    position = serializers.IntegerField(min_value=0)  # 0-based index in the venue queue
\ No newline at end of file
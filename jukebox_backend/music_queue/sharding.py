@@ -0,0 +1,151 @@
+"""
+Venue-sharded storage for queue data.
+
+QueueItem, QueuePayment and CurrentlyPlaying rows live on the database alias
+stored on their venue, so one busy venue's writes don't slow down every other
+venue. Venues, songs, users and Stripe events stay on 'default'.
+
+A new venue is placed on whichever of settings.QUEUE_SHARDS holds the fewest
+venues, and keeps that shard (Venue.queue_shard). Adding a shard only affects
+venues created afterwards; moving a venue means copying its rows by hand.
+
+Rules for code touching sharded models:
+- Query through QueueItem.objects.for_venue(venue) (or .using(shard)); Django
+  can't route a plain queryset because it has no instance to look at.
+  QueueItem.objects.create() and instance saves are routed by venue.
+- Wrap locking reads in transaction.atomic(using=shard_for_venue(venue)).
+- Don't select_related() song/venue/user, they're on another database.
+- Primary keys are only unique per shard.
+- Deleting a venue, song or user cascades through music_queue/signals.py, not
+  the database.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.db.models import Count
+from venues.models import Venue
+
+SHARDED_MODELS = {'music_queue.queueitem', 'music_queue.currentlyplaying', 'music_queue.queuepayment'}
+
+def queue_shards():
+    return list(settings.QUEUE_SHARDS)
+
+
+def pick_queue_shard():
+    """
+    Shard for a new venue: the one holding the fewest venues
+    """
+    shards = queue_shards()
+    counts = dict(
+        Venue.objects.filter(queue_shard__in=shards).values_list('queue_shard').annotate(Count('id')).order_by()
+    )
+    return min(shards, key=lambda shard: counts.get(shard, 0))
+
+
+def assign_queue_shard(sender, instance, **kwargs):
+    # pre_save on Venue
+    if not instance.queue_shard:
+        instance.queue_shard = pick_queue_shard()
+
+
+def shard_for_venue(venue):
+    """
+    Database alias holding a venue's queue rows. Accepts a Venue or its id.
+    """
+    if isinstance(venue, Venue):
+        shard = venue.queue_shard
+    else:
+        shard = Venue.objects.filter(pk=venue).values_list('queue_shard', flat=True).get()
+
+    if not shard:
+        # Saved without the pre_save hook, e.g. by bulk_create()
+        shard = pick_queue_shard()
+        Venue.objects.filter(pk=getattr(venue, 'pk', venue), queue_shard='').update(queue_shard=shard)
+        if isinstance(venue, Venue):
+            venue.queue_shard = shard
+    return shard
+
+
+def fan_out(func, shards=None):
+    """
+    Call func(alias) for every shard in parallel.
+    Returns {alias: result}.
+    """
+    shards = shards or queue_shards()
+    if len(shards) == 1:
+        return {shards[0]: func(shards[0])}
+
+    def run(alias):
+        try:
+            return func(alias)
+        finally:
+            # Each pool thread opened its own connection
+            connections[alias].close()
+
+    with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix='shard') as pool:
+        return dict(zip(shards, pool.map(run, shards)))
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+class VenueShardManager(models.Manager):
+    def for_venue(self, venue):
+        """
+        Rows for one venue, on that venue's shard. Accepts a Venue or its id.
+        """
+        return self.using(shard_for_venue(venue)).filter(venue_id=getattr(venue, 'pk', venue))
+
+    def create(self, **kwargs):
+        # Querysets have no instance for the router to go on, so place new rows here
+        venue = kwargs['venue'] if 'venue' in kwargs else kwargs['venue_id']
+        return self.using(shard_for_venue(venue)).create(**kwargs)
+
+
+class QueueShardRouter:
+    """
+    Routes queue models to their venue's shard when Django has an instance to go on
+    (saves, related lookups), and everything else to 'default'.
+    """
+
+    def _db_for(self, model, **hints):
+        if not is_sharded(model):
+            # Related lookups from a sharded row would otherwise stay on its shard
+            return DEFAULT_DB_ALIAS
+
+        # Runs on every FK assignment, so only use what's already in memory:
+        # no queries, and never pick or save a shard here (that's pre_save's job)
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if isinstance(instance, Venue):
+            return instance.queue_shard or None
+        if is_sharded(type(instance)):
+            if instance._state.db:
+                # Loaded from (or already saved to) its shard
+                return instance._state.db
+            venue_field = type(instance)._meta.get_field('venue')
+            if venue_field.is_cached(instance):
+                return venue_field.get_cached_value(instance).queue_shard or None
+            return None
+        return instance._state.db
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Queue rows point at venues, songs and users on 'default' without DB constraints
+        if is_sharded(type(obj1)) or is_sharded(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name and f"{app_label}.{model_name}" in SHARDED_MODELS:
+            return db in queue_shards()
+        # Everything else only exists on 'default'
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,33 @@
+"""
+Cascades for queue rows, which can't rely on the database or Django's
+collector because they may live on a different shard than what they point at.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_delete, pre_save
+from django.dispatch import receiver
+from venues.models import Song, Venue
+
+from .models import CurrentlyPlaying, QueueItem
+from .sharding import assign_queue_shard, queue_shards, shard_for_venue
+
+pre_save.connect(assign_queue_shard, sender=Venue)
+
+
+@receiver(pre_delete, sender=Venue)
+def delete_venue_queue(sender, instance, **kwargs):
+    shard = shard_for_venue(instance)
+    # Payments go with their queue items
+    QueueItem.objects.using(shard).filter(venue_id=instance.pk).delete()
+    CurrentlyPlaying.objects.using(shard).filter(venue_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=Song)
+def delete_song_queue_items(sender, instance, **kwargs):
+    for shard in queue_shards():
+        QueueItem.objects.using(shard).filter(song_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=User)
+def delete_user_queue_items(sender, instance, **kwargs):
+    for shard in queue_shards():
+        QueueItem.objects.using(shard).filter(user_id=instance.pk).delete()
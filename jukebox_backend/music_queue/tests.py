@@ -1,3 +1,740 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from jukebox_backend.ratelimit import CacheTokenBucketStore, LocalTokenBucketStore, get_client_ip, get_store
+from venues.models import Venue, Song
+from .models import CurrentlyPlaying, QueueItem, QueuePayment, StripeEvent
+from .ranking import rank_after, rank_between, spread_ranks, timestamp_rank
+from .sharding import QueueShardRouter, shard_for_venue
+from .views import merge_request
+
+TIGHT_RATE_LIMITS = {
+    'queue_add_free': {
+        'client': {'capacity': 1, 'refill_rate': 0.01},
+    },
+    'queue_add_paid': {
+        'client': {'capacity': 1, 'refill_rate': 0.01},
+    },
+}
+
+def song_payload(**overrides):
+    payload = {
+        'song_id': 'freesound_123',
+        'title': 'Test Track',
+        'artist': 'Test Artist',
+        'duration': 180,
+    }
+    payload.update(overrides)
+    return payload
+
+@override_settings(RATE_LIMITS=TIGHT_RATE_LIMITS)
+class AddToQueueRateLimitTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        get_store().clear()
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Test Venue', description='Test')
+        self.url = f'/api/venues/{self.venue.id}/queue/add/'
+
+    def test_free_adds_over_budget_are_rejected(self):
+        response = self.client.post(self.url, song_payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.post(self.url, song_payload(), format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) > 0)
+        self.assertEqual(QueueItem.objects.for_venue(self.venue).count(), 1)
+
+    def test_paid_adds_have_separate_budget(self):
+        self.client.post(self.url, song_payload(), format='json')
+
+        response = self.client.post(self.url, song_payload(
+            is_paid=True,
+            payment_method_id='pm_demo_web_payment'
+        ), format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_rejected_before_venue_lookup(self):
+        url = '/api/venues/9999/queue/add/'
+        self.client.post(url, song_payload(), format='json')
+
+        response = self.client.post(url, song_payload(), format='json')
+        self.assertEqual(response.status_code, 429)
+
+class TokenBucketStoreTests(SimpleTestCase):
+    def test_rejected_request_takes_no_tokens(self):
+        store = LocalTokenBucketStore()
+        buckets = [('client', 2, 0.001), ('venue', 1, 0.001)]
+
+        self.assertEqual(store.consume_all(buckets), 0)
+        self.assertGreater(store.consume_all(buckets), 0)
+
+        # The venue bucket rejected the second request, so the client still has a token left
+        self.assertEqual(store.consume('client', 2, 0.001), 0)
+        self.assertGreater(store.consume('client', 2, 0.001), 0)
+
+    def test_refilled_buckets_are_dropped(self):
+        store = LocalTokenBucketStore()
+        store.prune_interval = 0
+        store.consume('ip:198.51.100.1', 1, 1000)
+        store.consume('venue:999999', 1, 0.001)
+        time.sleep(0.01)
+
+        store.consume('ip:198.51.100.2', 1, 1000)
+
+        self.assertNotIn('ip:198.51.100.1', store._buckets)
+        self.assertIn('venue:999999', store._buckets)
+
+    def test_cache_store_shares_budget_between_workers(self):
+        cache.clear()
+        workers = [CacheTokenBucketStore(), CacheTokenBucketStore()]
+        buckets = [('client', 2, 0.001)]
+
+        self.assertEqual(workers[0].consume_all(buckets), 0)
+        self.assertEqual(workers[1].consume_all(buckets), 0)
+        self.assertGreater(workers[0].consume_all(buckets), 0)
+
+    def test_cache_store_backs_off_while_bucket_is_locked(self):
+        cache.clear()
+        store = CacheTokenBucketStore()
+        store.lock_timeout = 0.05
+        cache.add('ratelimit:client:lock', 1)
+
+        self.assertEqual(store.consume_all([('client', 2, 0.001)]), 0.05)
+        self.assertIsNone(cache.get('ratelimit:client'))
+
+class ClientIPTests(SimpleTestCase):
+    def request(self, forwarded_for):
+        return RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=forwarded_for)
+
+    @override_settings(TRUSTED_PROXY_COUNT=0)
+    def test_ignores_forwarded_for_without_trusted_proxies(self):
+        self.assertEqual(get_client_ip(self.request('203.0.113.7')), '10.0.0.1')
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_uses_hop_added_by_trusted_proxy(self):
+        self.assertEqual(get_client_ip(self.request('198.51.100.1, 203.0.113.7')), '203.0.113.7')
+
+    @override_settings(TRUSTED_PROXY_COUNT=2)
+    def test_falls_back_when_too_few_hops(self):
+        self.assertEqual(get_client_ip(self.request('203.0.113.7')), '10.0.0.1')
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class AddToQueueDedupeTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Test Venue', description='Test', dedupe_requests=True)
+        self.url = f'/api/venues/{self.venue.id}/queue/add/'
+
+    def test_repeat_request_merges_into_queued_item(self):
+        self.client.post(self.url, song_payload(), format='json')
+        response = self.client.post(self.url, song_payload(), format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(QueueItem.objects.for_venue(self.venue).count(), 1)
+        self.assertEqual(QueueItem.objects.for_venue(self.venue).get().request_count, 2)
+
+    def test_paid_repeat_request_promotes_item(self):
+        self.client.post(self.url, song_payload(), format='json')
+        self.client.post(self.url, song_payload(
+            is_paid=True,
+            payment_method_id='pm_demo_web_payment'
+        ), format='json')
+
+        queue_item = QueueItem.objects.for_venue(self.venue).get()
+        self.assertTrue(queue_item.is_paid)
+        self.assertEqual(str(queue_item.amount_paid), '1.00')
+
+    def test_concurrent_add_merges_on_unique_constraint(self):
+        self.client.post(self.url, song_payload(), format='json')
+
+        # Lose the race: the first dedupe lookup ran before the other insert committed
+        real_merge = merge_request
+        def merge_after_race(*args):
+            return None if mock_merge.call_count == 1 else real_merge(*args)
+
+        with mock.patch('music_queue.views.merge_request', side_effect=merge_after_race) as mock_merge:
+            response = self.client.post(self.url, song_payload(), format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(QueueItem.objects.for_venue(self.venue).count(), 1)
+        self.assertEqual(QueueItem.objects.for_venue(self.venue).get().request_count, 2)
+
+    def test_no_merge_when_dedupe_disabled(self):
+        self.venue.dedupe_requests = False
+        self.venue.save()
+
+        self.client.post(self.url, song_payload(), format='json')
+        self.client.post(self.url, song_payload(), format='json')
+
+        self.assertEqual(QueueItem.objects.for_venue(self.venue).count(), 2)
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class UpcomingSongsTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Test Venue', description='Test')
+
+    @mock.patch('music_queue.views.warm_upcoming')
+    def test_lists_next_items_with_preview_urls(self, mock_warm):
+        add_url = f'/api/venues/{self.venue.id}/queue/add/'
+        self.client.post(add_url, song_payload(), format='json')
+        self.client.post(add_url, song_payload(song_id='mock_1'), format='json')
+
+        response = self.client.get(f'/api/venues/{self.venue.id}/upcoming/?n=5')
+
+        self.assertEqual(response.status_code, 200)
+        upcoming = response.json()['upcoming']
+        self.assertEqual(len(upcoming), 2)
+        self.assertEqual(upcoming[0]['preview_url'], '/api/songs/123/preview/')
+        self.assertIsNone(upcoming[1]['preview_url'])
+        self.assertTrue(mock_warm.called)
+
+class RankingTests(SimpleTestCase):
+    def test_rank_between_sorts_between_neighbours(self):
+        ranks = [rank_after(None)]
+        ranks.append(rank_after(ranks[0]))
+        for _ in range(200):
+            ranks.sort()
+            before, after = ranks[len(ranks) // 2 - 1], ranks[len(ranks) // 2]
+            rank = rank_between(before, after)
+            self.assertTrue(before < rank < after)
+            ranks.append(rank)
+
+    def test_rank_between_unbounded(self):
+        self.assertTrue(rank_between(None, '1') < '1')
+        self.assertTrue(rank_between('z', None) > 'z')
+
+    def test_spread_ranks_sorted_and_distinct(self):
+        now = timezone.now()
+        for start in (now - timedelta(hours=1), now):
+            for count in (1, 35, 36, 1300):
+                ranks = spread_ranks(count, start, now)
+                self.assertEqual(len(set(ranks)), count)
+                self.assertEqual(ranks, sorted(ranks))
+                self.assertTrue(all(len(rank) == len(timestamp_rank(now)) for rank in ranks))
+                self.assertLessEqual(ranks[-1], timestamp_rank(now))
+
+@override_settings(RATE_LIMIT_ENABLED=False, PREFETCH_ENABLED=False)
+class QueueStaffOperationsTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Test Venue', description='Test')
+        self.queue_url = f'/api/venues/{self.venue.id}/queue/'
+        self.items = []
+        for i in range(3):
+            response = self.client.post(f'{self.queue_url}add/', song_payload(song_id=f'mock_{i}'), format='json')
+            self.items.append(response.json()['queue_item']['id'])
+
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def queue_ids(self):
+        return [item['id'] for item in self.client.get(self.queue_url).json()['queue']]
+
+    def test_patrons_cannot_manage_queue(self):
+        self.client.force_authenticate(None)
+
+        responses = [
+            self.client.post(f'{self.queue_url}{self.items[0]}/skip/'),
+            self.client.delete(f'{self.queue_url}{self.items[0]}/'),
+            self.client.post(f'{self.queue_url}{self.items[0]}/move/', {'position': 2}, format='json'),
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [403, 403, 403])
+        self.assertEqual(self.queue_ids(), self.items)
+
+    def test_move_updates_order(self):
+        response = self.client.post(f'{self.queue_url}{self.items[2]}/move/', {'position': 0}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.queue_ids(), [self.items[2], self.items[0], self.items[1]])
+
+    def test_move_between_tied_ranks_reranks_tier(self):
+        # Two songs appended in the same microsecond share a rank
+        items = QueueItem.objects.for_venue(self.venue)
+        items.filter(id__in=self.items[:2]).update(position=items.get(id=self.items[0]).position)
+
+        response = self.client.post(f'{self.queue_url}{self.items[2]}/move/', {'position': 1}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.queue_ids(), [self.items[0], self.items[2], self.items[1]])
+        self.assertEqual(len(set(items.values_list('position', flat=True))), 3)
+
+        # Appends after a re-rank are plain fixed-width timestamp ranks again
+        for i in range(20):
+            self.client.post(f'{self.queue_url}add/', song_payload(song_id=f'mock_new_{i}'), format='json')
+        last = items.filter(status='queued').order_by('-position').first()
+        self.assertEqual(last.song.external_id, 'mock_new_19')
+        self.assertEqual(len(last.position), len(timestamp_rank()))
+
+    def test_free_song_cannot_move_above_paid(self):
+        response = self.client.post(f'{self.queue_url}add/', song_payload(
+            song_id='mock_paid',
+            is_paid=True,
+            payment_method_id='pm_demo_web_payment'
+        ), format='json')
+        paid_id = response.json()['queue_item']['id']
+
+        self.client.post(f'{self.queue_url}{self.items[1]}/move/', {'position': 0}, format='json')
+        self.assertEqual(self.queue_ids(), [paid_id, self.items[1], self.items[0], self.items[2]])
+
+    def test_skip_and_remove(self):
+        self.client.post(f'{self.queue_url}{self.items[0]}/skip/')
+        response = self.client.delete(f'{self.queue_url}{self.items[1]}/')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(QueueItem.objects.for_venue(self.venue).get(id=self.items[0]).status, 'skipped')
+        self.assertEqual(self.queue_ids(), [self.items[2]])
+
+    @mock.patch('music_queue.views.warm_upcoming')
+    def test_queue_changes_warm_upcoming(self, mock_warm):
+        self.client.post(f'{self.queue_url}{self.items[2]}/move/', {'position': 0}, format='json')
+        self.client.post(f'{self.queue_url}{self.items[2]}/skip/')
+        self.client.delete(f'{self.queue_url}{self.items[1]}/')
+
+        self.assertEqual(mock_warm.call_count, 3)
+        mock_warm.assert_called_with(self.venue)
+
+    def test_skip_playing_song_advances(self):
+        self.client.post(f'/api/venues/{self.venue.id}/next/')
+        response = self.client.post(f'{self.queue_url}{self.items[0]}/skip/')
+
+        self.assertEqual(response.json()['currently_playing']['queue_item']['id'], self.items[1])
+        self.assertEqual(QueueItem.objects.for_venue(self.venue).get(id=self.items[0]).status, 'skipped')
+
+@override_settings(RATE_LIMIT_ENABLED=False, PREFETCH_ENABLED=False)
+class VenueQueueRendererTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Test Venue', description='Test')
+        self.client.post(f'/api/venues/{self.venue.id}/queue/add/', song_payload(), format='json')
+        self.url = f'/api/venues/{self.venue.id}/queue/'
+
+    def test_json_by_default(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['queue'][0]['song']['title'], 'Test Track')
+
+    def test_columnar_json_on_request(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/vnd.jukebox.columnar+json')
+
+        self.assertEqual(response['Content-Type'], 'application/vnd.jukebox.columnar+json')
+        queue = json.loads(response.content)['queue']
+        self.assertEqual(queue['rows'][0][queue['columns'].index('song.title')], 'Test Track')
+
+    def test_columnar_json_empty_queue_keeps_shape(self):
+        venue = Venue.objects.create(name='Empty Venue', description='Test')
+        response = self.client.get(f'/api/venues/{venue.id}/queue/', HTTP_ACCEPT='application/vnd.jukebox.columnar+json')
+
+        self.assertEqual(json.loads(response.content)['queue'], {'columns': [], 'rows': []})
+
+WEBHOOK_SECRET = 'whsec_test_secret'
+
+def signed_webhook_payload(event, secret=WEBHOOK_SECRET):
+    """
+    Sign an event the same way Stripe does, for posting to the webhook locally
+    """
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return payload, f't={timestamp},v1={signature}'
+
+def payment_intent_event(event_type, payment_intent_id, venue=None, event_id='evt_1', amount=100):
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': event_type,
+        'data': {
+            'object': {
+                'id': payment_intent_id,
+                'object': 'payment_intent',
+                'amount_received': amount,
+                'metadata': {'venue_id': str(venue.id)} if venue else {},
+            }
+        }
+    }
+
+@override_settings(RATE_LIMIT_ENABLED=False, PREFETCH_ENABLED=False, STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Test Venue', description='Test')
+        self.webhook_url = '/api/payments/stripe/webhook/'
+
+    def add_pending_paid_song(self):
+        payment_intent = mock.Mock(id='pi_123', status='requires_action', client_secret='pi_123_secret')
+        with mock.patch('stripe.PaymentIntent.create', return_value=payment_intent):
+            return self.client.post(f'/api/venues/{self.venue.id}/queue/add/', song_payload(
+                is_paid=True,
+                payment_method_id='pm_card_threeDSecure2Required'
+            ), format='json')
+
+    def post_event(self, event, secret=WEBHOOK_SECRET):
+        payload, signature = signed_webhook_payload(event, secret)
+        return self.client.generic('POST', self.webhook_url, payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+
+    def test_requires_action_queues_song_pending(self):
+        response = self.add_pending_paid_song()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['payment_intent_client_secret'], 'pi_123_secret')
+        queue_item = QueueItem.objects.for_venue(self.venue).get()
+        self.assertFalse(queue_item.is_paid)
+        self.assertEqual(queue_item.payment_status, 'pending')
+        self.assertEqual(queue_item.status, 'pending')
+
+    def test_pending_song_is_not_playable(self):
+        self.add_pending_paid_song()
+
+        queue = self.client.get(f'/api/venues/{self.venue.id}/queue/').json()['queue']
+        self.assertEqual(queue, [])
+        self.client.post(f'/api/venues/{self.venue.id}/next/')
+        self.assertEqual(QueueItem.objects.for_venue(self.venue).get().status, 'pending')
+
+    def test_succeeded_event_promotes_song(self):
+        self.client.post(f'/api/venues/{self.venue.id}/queue/add/', song_payload(song_id='mock_free'), format='json')
+        self.add_pending_paid_song()
+
+        response = self.post_event(payment_intent_event('payment_intent.succeeded', 'pi_123', self.venue))
+
+        self.assertEqual(response.status_code, 200)
+        queue_item = QueuePayment.objects.for_venue(self.venue).get(stripe_payment_intent_id='pi_123').queue_item
+        self.assertTrue(queue_item.is_paid)
+        self.assertEqual(queue_item.payment_status, 'succeeded')
+        self.assertEqual(str(queue_item.amount_paid), '1.00')
+        queue = self.client.get(f'/api/venues/{self.venue.id}/queue/').json()['queue']
+        self.assertEqual(queue[0]['id'], queue_item.id)
+
+    def test_succeeded_event_merges_into_queued_request_when_deduping(self):
+        self.venue.dedupe_requests = True
+        self.venue.save()
+        self.add_pending_paid_song()
+        self.client.post(f'/api/venues/{self.venue.id}/queue/add/', song_payload(), format='json')
+
+        response = self.post_event(payment_intent_event('payment_intent.succeeded', 'pi_123', self.venue))
+
+        self.assertEqual(response.status_code, 200)
+        items = QueueItem.objects.for_venue(self.venue)
+        queued = items.get(status='queued')
+        self.assertEqual(queued.request_count, 2)
+        self.assertTrue(queued.is_paid)
+        self.assertEqual(str(queued.amount_paid), '1.00')
+        self.assertEqual(QueuePayment.objects.for_venue(self.venue).get().queue_item_id, queued.id)
+        self.assertEqual(items.exclude(id=queued.id).get().status, 'cancelled')
+
+    def test_redelivered_event_handled_once(self):
+        self.add_pending_paid_song()
+        event = payment_intent_event('payment_intent.succeeded', 'pi_123', self.venue)
+        self.post_event(event)
+
+        with mock.patch('music_queue.views.handle_stripe_event') as mock_handle:
+            response = self.post_event(event)
+
+        self.assertTrue(response.json()['duplicate'])
+        mock_handle.assert_not_called()
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_failed_event_marks_payment_failed(self):
+        self.add_pending_paid_song()
+
+        self.post_event(payment_intent_event('payment_intent.payment_failed', 'pi_123', self.venue))
+
+        queue_item = QueueItem.objects.for_venue(self.venue).get()
+        self.assertFalse(queue_item.is_paid)
+        self.assertEqual(queue_item.payment_status, 'failed')
+        self.assertEqual(queue_item.status, 'cancelled')
+        self.assertEqual(self.client.get(f'/api/venues/{self.venue.id}/queue/').json()['queue'], [])
+        self.client.post(f'/api/venues/{self.venue.id}/next/')
+        self.assertEqual(QueueItem.objects.for_venue(self.venue).get().status, 'cancelled')
+
+    def test_succeeded_event_before_queue_item_is_retried(self):
+        event = payment_intent_event('payment_intent.succeeded', 'pi_123', self.venue)
+
+        response = self.post_event(event)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNone(StripeEvent.objects.get().processed_at)
+
+        self.add_pending_paid_song()
+        response = self.post_event(event)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('duplicate', response.json())
+        self.assertTrue(QueueItem.objects.for_venue(self.venue).get().is_paid)
+
+    def test_other_payment_intents_are_acknowledged(self):
+        response = self.post_event(payment_intent_event('payment_intent.succeeded', 'pi_other_product'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(StripeEvent.objects.get().processed_at)
+
+    def test_payment_intent_carries_venue(self):
+        payment_intent = mock.Mock(id='pi_123', status='succeeded')
+        with mock.patch('stripe.PaymentIntent.create', return_value=payment_intent) as mock_create:
+            self.client.post(f'/api/venues/{self.venue.id}/queue/add/', song_payload(
+                is_paid=True,
+                payment_method_id='pm_card_visa'
+            ), format='json')
+
+        self.assertEqual(mock_create.call_args.kwargs['metadata'], {'venue_id': self.venue.id})
+
+    def test_rejects_bad_signature(self):
+        response = self.post_event(payment_intent_event('payment_intent.succeeded', 'pi_123', self.venue), secret='whsec_wrong')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(StripeEvent.objects.count(), 0)
+
+def stripe_charge(charge_id, payment_intent_id, amount=100, amount_refunded=0, status='succeeded'):
+    return {
+        'id': charge_id,
+        'payment_intent': payment_intent_id,
+        'amount': amount,
+        'amount_refunded': amount_refunded,
+        'status': status,
+    }
+
+class ReconcilePaymentsTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.venue = Venue.objects.create(name='Test Venue', description='Test', dedupe_requests=True)
+        song = Song.objects.create(title='Test Track', artist='Test Artist', duration=180, external_id='mock_1')
+        self.matched = self.paid_item(song, 'pi_matched')
+        self.pending = QueueItem.objects.create(venue=self.venue, song=song, status='pending', payment_status='pending')
+        QueuePayment.objects.create(
+            venue=self.venue, queue_item=self.pending, stripe_payment_intent_id='pi_pending', amount=Decimal('1.00')
+        )
+        self.uncharged = self.paid_item(song, 'pi_uncharged')
+
+    def paid_item(self, song, intent_id):
+        queue_item = QueueItem.objects.create(
+            venue=self.venue, song=song, is_paid=True, amount_paid=Decimal('1.00'), payment_status='succeeded'
+        )
+        QueuePayment.objects.create(
+            venue=self.venue, queue_item=queue_item, stripe_payment_intent_id=intent_id,
+            amount=Decimal('1.00'), status='succeeded'
+        )
+        return queue_item
+
+    def reconcile(self, charges):
+        charge_list = mock.Mock()
+        charge_list.auto_paging_iter.return_value = iter(charges)
+        output = StringIO()
+        with mock.patch('stripe.Charge.list', return_value=charge_list):
+            call_command('reconcile_payments', stdout=output)
+        return output.getvalue()
+
+    def test_flags_mismatches(self):
+        output = self.reconcile([
+            stripe_charge('ch_1', 'pi_matched'),
+            stripe_charge('ch_2', 'pi_pending'),
+            stripe_charge('ch_3', 'pi_orphan'),
+            stripe_charge('ch_4', 'pi_failed', status='failed'),
+        ])
+
+        self.assertIn('Matched: 1', output)
+        self.assertRegex(output, rf'Queue item {self.pending.id}( on \w+)? is pending')
+        self.assertIn('Charge ch_3 for 1.00 (pi_orphan) has no queue item', output)
+        self.assertRegex(output, rf'Queue item {self.uncharged.id}( on \w+)? recorded 1.00 paid')
+        self.assertIn('Mismatches: 3', output)
+
+    def test_refunds_count_against_amount(self):
+        output = self.reconcile([
+            stripe_charge('ch_1', 'pi_matched', amount_refunded=100),
+            stripe_charge('ch_2', 'pi_uncharged'),
+        ])
+
+        self.assertRegex(output, rf'Queue item {self.matched.id}( on \w+)? recorded 1.00 but Stripe charged 0.00')
+
+    def test_merged_paid_requests_keep_every_payment(self):
+        url = f'/api/venues/{self.venue.id}/queue/add/'
+        client = APIClient()
+        for intent_id in ('pi_first', 'pi_second'):
+            payment_intent = mock.Mock(id=intent_id, status='succeeded')
+            with override_settings(RATE_LIMIT_ENABLED=False), \
+                    mock.patch('stripe.PaymentIntent.create', return_value=payment_intent):
+                client.post(url, song_payload(song_id='mock_merged', is_paid=True, payment_method_id='pm_card_visa'), format='json')
+
+        queue_item = QueueItem.objects.for_venue(self.venue).get(song=Song.objects.get(external_id='mock_merged'))
+        self.assertEqual(queue_item.request_count, 2)
+        self.assertEqual(str(queue_item.amount_paid), '2.00')
+
+        output = self.reconcile([
+            stripe_charge('ch_1', 'pi_matched'),
+            stripe_charge('ch_2', 'pi_uncharged'),
+            stripe_charge('ch_3', 'pi_first'),
+            stripe_charge('ch_4', 'pi_second'),
+        ])
+
+        self.assertIn('Matched: 4', output)
+        self.assertNotIn(f'Queue item {queue_item.id} ', output)
+        self.assertNotIn('has no queue item', output)
+
+@override_settings(QUEUE_SHARDS=['default', 'shard1', 'shard2'])
+class ShardRoutingTests(SimpleTestCase):
+    def test_venue_keeps_stored_shard(self):
+        self.assertEqual(shard_for_venue(Venue(id=3, queue_shard='shard2')), 'shard2')
+
+    def test_router_follows_instance_venue(self):
+        router = QueueShardRouter()
+        venue = Venue(id=5, queue_shard='shard2')
+        item = QueueItem(venue=venue)
+        loaded = QueueItem(venue_id=5)
+        loaded._state.db = 'shard1'
+
+        self.assertEqual(router.db_for_write(QueueItem, instance=item), 'shard2')
+        self.assertEqual(router.db_for_read(QueueItem, instance=venue), 'shard2')
+        self.assertEqual(router.db_for_read(QueueItem, instance=loaded), 'shard1')
+        self.assertEqual(router.db_for_read(Venue, instance=item), 'default')
+        self.assertIsNone(router.db_for_read(QueueItem))
+
+    def test_queue_tables_only_migrate_on_shards(self):
+        router = QueueShardRouter()
+        self.assertTrue(router.allow_migrate('shard1', 'music_queue', 'queueitem'))
+        self.assertFalse(router.allow_migrate('other', 'music_queue', 'queueitem'))
+        self.assertFalse(router.allow_migrate('shard1', 'venues', 'venue'))
+        self.assertTrue(router.allow_migrate('default', 'venues', 'venue'))
+
+class ShardPlacementTests(TestCase):
+    @override_settings(QUEUE_SHARDS=['default', 'shard1'])
+    def test_new_venues_fill_least_used_shard(self):
+        first = Venue.objects.create(name='First', description='Test')
+        second = Venue.objects.create(name='Second', description='Test')
+        self.assertEqual([first.queue_shard, second.queue_shard], ['default', 'shard1'])
+
+        # Adding a shard leaves existing venues where their rows are
+        with override_settings(QUEUE_SHARDS=['default', 'shard1', 'shard2']):
+            third = Venue.objects.create(name='Third', description='Test')
+            self.assertEqual(shard_for_venue(first.id), 'default')
+            self.assertEqual(shard_for_venue(second.id), 'shard1')
+            self.assertEqual(third.queue_shard, 'shard2')
+
+    def test_venue_without_shard_gets_one(self):
+        Venue.objects.bulk_create([Venue(name='Bulk', description='Test')])
+        venue = Venue.objects.get()
+
+        self.assertEqual(shard_for_venue(venue), settings.QUEUE_SHARDS[0])
+        self.assertEqual(Venue.objects.get().queue_shard, settings.QUEUE_SHARDS[0])
+
+    def test_building_queue_rows_runs_no_queries(self):
+        # The router sees every FK assignment; it must not pick or save shards
+        venue = Venue(id=1, name='Unsaved')
+        with self.assertNumQueries(0):
+            QueueItem(venue=venue, song=Song(id=1))
+        self.assertEqual(venue.queue_shard, '')
+
+class StoreCurrentShardsMigrationTests(TestCase):
+    # venues/migrations/0003: queue rows were all on 'default' before venues had a shard
+    migration = import_module('venues.migrations.0003_venue_queue_shard')
+
+    def run_migration(self):
+        self.migration.store_current_shards(django_apps, mock.Mock(connection=connection))
+
+    @override_settings(QUEUE_SHARDS=['default', 'shard1'])
+    def test_existing_venues_stay_on_default(self):
+        Venue.objects.bulk_create([Venue(name=f'Venue {i}', description='Test') for i in range(3)])
+
+        self.run_migration()
+
+        self.assertEqual(set(Venue.objects.values_list('queue_shard', flat=True)), {'default'})
+
+    @skipUnless('default' in settings.QUEUE_SHARDS, 'Needs queue tables on default')
+    def test_refuses_when_default_is_not_a_shard(self):
+        Venue.objects.bulk_create([Venue(name='Venue', description='Test')])
+        venue = Venue.objects.get()
+        QueueItem(venue=venue, song=Song.objects.create(external_id='s1', title='T', artist='A', duration=1)).save(using='default')
+
+        with override_settings(QUEUE_SHARDS=['shard0', 'shard1']):
+            with self.assertRaises(RuntimeError):
+                self.run_migration()
+
+@override_settings(RATE_LIMIT_ENABLED=False, PREFETCH_ENABLED=False)
+class QueueShardingTests(TransactionTestCase):
+    # Overview queries run on pool threads, which can't see a TestCase's open transaction
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.venues = [Venue.objects.create(name=f'Venue {i}', description='Test') for i in range(2)]
+        for venue in self.venues:
+            self.client.post(f'/api/venues/{venue.id}/queue/add/', song_payload(), format='json')
+
+    def test_queue_rows_live_on_venue_shard(self):
+        for venue in self.venues:
+            shard = shard_for_venue(venue)
+            self.assertEqual(QueueItem.objects.using(shard).filter(venue=venue).count(), 1)
+            for other in settings.QUEUE_SHARDS:
+                if other != shard:
+                    self.assertFalse(QueueItem.objects.using(other).filter(venue=venue).exists())
+
+    def test_next_song_reads_from_venue_shard(self):
+        venue = self.venues[1]
+        response = self.client.post(f'/api/venues/{venue.id}/next/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(QueueItem.objects.for_venue(venue).get().status, 'playing')
+
+    def test_deleting_venue_or_song_removes_queue_rows_on_every_shard(self):
+        venue = self.venues[0]
+        self.client.post(f'/api/venues/{venue.id}/next/')
+
+        venue.delete()
+
+        for shard in settings.QUEUE_SHARDS:
+            self.assertFalse(QueueItem.objects.using(shard).filter(venue_id=venue.id).exists())
+            self.assertFalse(CurrentlyPlaying.objects.using(shard).filter(venue_id=venue.id).exists())
+
+        Song.objects.get().delete()
+
+        for shard in settings.QUEUE_SHARDS:
+            self.assertFalse(QueueItem.objects.using(shard).exists())
+
+    def test_overview_requires_admin(self):
+        response = self.client.get('/api/queues/overview/')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_overview_totals_every_venue(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(admin)
+
+        response = self.client.get('/api/queues/overview/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['shards'], list(settings.QUEUE_SHARDS))
+        venues = response.json()['venues']
+        self.assertEqual([venue['venue_id'] for venue in venues], [venue.id for venue in self.venues])
+        self.assertEqual(venues[0]['venue_name'], 'Venue 0')
+        self.assertEqual(venues[1]['shard'], shard_for_venue(self.venues[1]))
+        self.assertEqual(venues[1]['queued'], 1)
+
+    @skipUnless(len(settings.QUEUE_SHARDS) > 1, 'Run with QUEUE_SHARDS=default,shard1 to test several shards')
+    def test_venues_split_across_shards(self):
+        self.assertNotEqual(shard_for_venue(self.venues[0]), shard_for_venue(self.venues[1]))
@@ -1,8 +1,17 @@
 from django.urls import path
-from .views import venue_queue, add_to_queue, next_song
+from .views import (
+    venue_queue, add_to_queue, next_song, upcoming_songs,
+    skip_song, remove_from_queue, move_in_queue, stripe_webhook, queue_overview,
+)
 
 urlpatterns = [
     path('venues/<int:venue_id>/queue/', venue_queue, name='venue-queue'),
     path('venues/<int:venue_id>/queue/add/', add_to_queue, name='add-to-queue'),
+    path('venues/<int:venue_id>/queue/<int:item_id>/', remove_from_queue, name='remove-from-queue'),
+    path('venues/<int:venue_id>/queue/<int:item_id>/skip/', skip_song, name='skip-song'),
+    path('venues/<int:venue_id>/queue/<int:item_id>/move/', move_in_queue, name='move-in-queue'),
     path('venues/<int:venue_id>/next/', next_song, name='next-song'),
+    path('venues/<int:venue_id>/upcoming/', upcoming_songs, name='upcoming-songs'),
+    path('queues/overview/', queue_overview, name='queue-overview'),
+    path('payments/stripe/webhook/', stripe_webhook, name='stripe-webhook'),
 ]
\ No newline at end of file
@@ -1,34 +1,46 @@
 from rest_framework import generics, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from decimal import Decimal
-import stripe
-import os
-from .models import QueueItem, CurrentlyPlaying
+import json
+from jukebox_backend.integrations import get_stripe
+from jukebox_backend.ratelimit import rate_limit
+from jukebox_backend.renderers import COMPACT_RENDERER_CLASSES
+from .models import QueueItem, QueuePayment, CurrentlyPlaying, StripeEvent
+from .prefetch import upcoming_items, warm_upcoming
+from .ranking import rank_after, rank_between, spread_ranks
+from .sharding import fan_out, queue_shards, shard_for_venue
 from venues.models import Venue, Song
-from .serializers import QueueItemSerializer, CurrentlyPlayingSerializer, AddToQueueSerializer
+from .serializers import QueueItemSerializer, CurrentlyPlayingSerializer, AddToQueueSerializer, MoveQueueItemSerializer
 
-# Configure Stripe
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+PAID_SONG_PRICE = Decimal('1.00')
 
 @api_view(['GET'])
+@renderer_classes(COMPACT_RENDERER_CLASSES)
 def venue_queue(request, venue_id):
     venue = get_object_or_404(Venue, id=venue_id)
     
     # Get currently playing
     try:
-        currently_playing = CurrentlyPlaying.objects.get(venue=venue)
+        currently_playing = CurrentlyPlaying.objects.for_venue(venue).get()
         current_song = CurrentlyPlayingSerializer(currently_playing).data
     except CurrentlyPlaying.DoesNotExist:
         current_song = None
     
     # Get next 10 songs in queue
-    queue_items = QueueItem.objects.filter(
-        venue=venue,
+    queue_items = QueueItem.objects.for_venue(venue).filter(
         status='queued'
-    ).order_by('-is_paid', 'queued_at')[:10]
+    ).order_by('-is_paid', 'position')[:10]
     
     queue_data = QueueItemSerializer(queue_items, many=True).data
     
@@ -39,7 +51,17 @@ def venue_queue(request, venue_id):
         'queue': queue_data
     })
 
+def queue_add_scope(request):
+    """
+    Paid and free adds draw from separate rate limit budgets
+    """
+    is_paid = request.data.get('is_paid', False) if hasattr(request.data, 'get') else False
+    if str(is_paid).lower() in ('true', '1'):
+        return 'queue_add_paid'
+    return 'queue_add_free'
+
 @api_view(['POST'])
+@rate_limit(queue_add_scope)
 def add_to_queue(request, venue_id):
     venue = get_object_or_404(Venue, id=venue_id)
     serializer = AddToQueueSerializer(data=request.data)
@@ -50,6 +72,8 @@ def add_to_queue(request, venue_id):
     data = serializer.validated_data
     
     # Handle payment if paid song
+    payment_status = 'free'
+    payment_intent = None
     if data.get('is_paid', False):
         payment_method_id = data.get('payment_method_id')
         if not payment_method_id:
@@ -58,8 +82,8 @@ def add_to_queue(request, venue_id):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Process real Stripe payment
-        payment_success = process_payment(payment_method_id, Decimal('1.00'))
-        if not payment_success:
+        payment_status, payment_intent = process_payment(payment_method_id, PAID_SONG_PRICE, venue)
+        if payment_status == 'failed':
             return Response({
                 'error': 'Payment failed. Please check your card and try again.'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -75,79 +99,284 @@ def add_to_queue(request, venue_id):
         }
     )
     
+    # Pending payments wait outside the queue until the Stripe webhook confirms them
+    is_paid = payment_status == 'succeeded'
+    amount = PAID_SONG_PRICE if is_paid else Decimal('0.00')
+    
+    # Merge into an already queued request for the same song if the venue dedupes.
+    # Pending payments get their own item so the webhook can promote it.
+    dedupe = venue.dedupe_requests and payment_status != 'pending'
+    if dedupe:
+        existing_item = merge_request(venue, song, amount, payment_intent, payment_status)
+        if existing_item:
+            return merged_response(venue, existing_item, is_paid)
+    
     # Create queue item
-    queue_item = QueueItem.objects.create(
-        venue=venue,
-        song=song,
-        is_paid=data.get('is_paid', False),
-        amount_paid=Decimal('1.00') if data.get('is_paid', False) else Decimal('0.00'),
-        user=request.user if request.user.is_authenticated else None
-    )
+    try:
+        with transaction.atomic(using=shard_for_venue(venue)):
+            queue_item = QueueItem.objects.create(
+                venue=venue,
+                song=song,
+                is_paid=is_paid,
+                amount_paid=amount,
+                payment_status=payment_status,
+                status='pending' if payment_status == 'pending' else 'queued',
+                dedupe=dedupe,
+                user=request.user if request.user.is_authenticated else None
+            )
+            record_payment(queue_item, payment_intent, payment_status)
+    except IntegrityError:
+        if not dedupe:
+            raise
+        # A concurrent request queued the same song after our lookup; merge into it
+        existing_item = merge_request(venue, song, amount, payment_intent, payment_status)
+        if existing_item is None:
+            raise
+        return merged_response(venue, existing_item, is_paid)
+    
+    warm_upcoming(venue)
+    
+    if payment_status == 'pending':
+        # Client finishes 3D Secure with the client secret; the webhook promotes the song
+        return Response({
+            'message': 'Song will be queued once payment is confirmed',
+            'queue_item': QueueItemSerializer(queue_item).data,
+            'payment_intent_client_secret': payment_intent.client_secret
+        }, status=status.HTTP_202_ACCEPTED)
     
     return Response({
         'message': 'Song added to queue successfully',
         'queue_item': QueueItemSerializer(queue_item).data
     }, status=status.HTTP_201_CREATED)
 
-def process_payment(payment_method_id, amount):
+def merge_request(venue, song, amount, payment_intent, payment_status):
+    """
+    Count a repeat request against the song's queued item, if there is one
+    """
+    is_paid = payment_status == 'succeeded'
+    with transaction.atomic(using=shard_for_venue(venue)):
+        existing_item = QueueItem.objects.for_venue(venue).select_for_update().filter(
+            song=song,
+            status='queued'
+        ).first()
+        
+        if existing_item:
+            existing_item.request_count = F('request_count') + 1
+            existing_item.amount_paid = F('amount_paid') + amount
+            if is_paid and not existing_item.is_paid:
+                # Paid request promotes the item to the end of the paid tier
+                existing_item.is_paid = True
+                existing_item.payment_status = 'succeeded'
+                existing_item.position = QueueItem.tail_position(venue, True)
+            existing_item.save(update_fields=['request_count', 'amount_paid', 'is_paid', 'payment_status', 'position'])
+            existing_item.refresh_from_db()
+            record_payment(existing_item, payment_intent, payment_status)
+    return existing_item
+
+def merged_response(venue, queue_item, is_paid):
+    """
+    Response for a request that was merged into an existing queue item
+    """
+    if is_paid:
+        warm_upcoming(venue)
+    
+    return Response({
+        'message': 'Song already queued, request merged',
+        'queue_item': QueueItemSerializer(queue_item).data
+    }, status=status.HTTP_200_OK)
+
+def record_payment(queue_item, payment_intent, payment_status):
+    """
+    Keep the Stripe PaymentIntent behind a request for the webhook and reconciliation
+    """
+    if payment_intent is None:
+        # Demo payments never reach Stripe
+        return
+    QueuePayment.objects.create(
+        venue_id=queue_item.venue_id,
+        queue_item=queue_item,
+        stripe_payment_intent_id=payment_intent.id,
+        amount=PAID_SONG_PRICE,
+        status=payment_status
+    )
+
+def process_payment(payment_method_id, amount, venue):
     """
     Process payment using Stripe API
+    Returns (payment_status, payment_intent) where payment_status is 'succeeded',
+    'pending' (needs customer action or is still processing) or 'failed'
     """
     # Handle demo payment for web
     if payment_method_id == 'pm_demo_web_payment':
         print("Demo payment processed successfully")
-        return True
-        
+        return 'succeeded', None
+    
+    stripe = get_stripe()
     try:
-        # Create payment intent
+        # Create payment intent; Stripe confirms it after any 3D Secure step
         payment_intent = stripe.PaymentIntent.create(
             amount=int(amount * 100),  # Convert to cents
             currency='usd',
             payment_method=payment_method_id,
-            confirmation_method='manual',
             confirm=True,
             return_url='http://localhost:8081',  # Your app URL
+            metadata={'venue_id': venue.id},  # Lets the webhook find the venue's shard
         )
         
         if payment_intent.status == 'succeeded':
-            return True
-        elif payment_intent.status == 'requires_action':
-            # Handle 3D Secure or other authentication
-            return False
+            return 'succeeded', payment_intent
+        elif payment_intent.status in ('requires_action', 'processing'):
+            # 3D Secure or async payment, outcome arrives via webhook
+            return 'pending', payment_intent
         else:
-            return False
+            return 'failed', payment_intent
             
     except stripe.error.CardError as e:
         print(f"Card error: {e}")
-        return False
+        return 'failed', None
     except stripe.error.StripeError as e:
         print(f"Stripe error: {e}")
-        return False
+        return 'failed', None
     except Exception as e:
         print(f"Payment processing error: {e}")
-        return False
+        return 'failed', None
 
-@api_view(['POST'])
-def next_song(request, venue_id):
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
     """
-    Move to the next song in queue (for venue staff/admin use)
+    Receive Stripe events and settle pending payments.
+    Events are stored by id so Stripe's redeliveries are only handled once.
     """
-    venue = get_object_or_404(Venue, id=venue_id)
+    stripe = get_stripe()
+    try:
+        event = stripe.Webhook.construct_event(
+            request.body,
+            request.META.get('HTTP_STRIPE_SIGNATURE'),
+            settings.STRIPE_WEBHOOK_SECRET
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid payload'}, status=400)
+    except stripe.error.SignatureVerificationError:
+        return JsonResponse({'error': 'Invalid signature'}, status=400)
+    
+    with transaction.atomic():
+        stripe_event, created = StripeEvent.objects.select_for_update().get_or_create(
+            event_id=event['id'],
+            defaults={
+                'event_type': event['type'],
+                'payload': json.loads(request.body)
+            }
+        )
+        if stripe_event.processed_at:
+            return JsonResponse({'received': True, 'duplicate': True})
+        
+        if not handle_stripe_event(event):
+            # add_to_queue may not have saved the item yet; leave the event
+            # unprocessed and have Stripe redeliver it
+            return JsonResponse({'error': 'No queue item for this payment yet'}, status=409)
+        
+        stripe_event.processed_at = timezone.now()
+        stripe_event.save(update_fields=['processed_at'])
+    
+    return JsonResponse({'received': True})
+
+def handle_stripe_event(event):
+    """
+    Apply a verified Stripe event to the payment and queue item for its PaymentIntent.
+    Returns False if a successful jukebox payment has no queue item to apply it to.
+    """
+    if event['type'] not in ('payment_intent.succeeded', 'payment_intent.payment_failed', 'payment_intent.canceled'):
+        return True
+    
+    payment_intent = event['data']['object']
+    metadata = payment_intent['metadata'] if 'metadata' in payment_intent else {}
+    venue_id = metadata['venue_id'] if 'venue_id' in metadata else None
+    if not venue_id:
+        # Not created by add_to_queue (e.g. another product on the account)
+        return True
     
-    # Mark current song as played
     try:
-        currently_playing = CurrentlyPlaying.objects.get(venue=venue)
+        shard = shard_for_venue(int(venue_id))
+    except Venue.DoesNotExist:
+        return True
+    
+    with transaction.atomic(using=shard):
+        payment = QueuePayment.objects.using(shard).select_for_update().filter(
+            stripe_payment_intent_id=payment_intent['id']
+        ).first()
+        if payment is not None:
+            apply_payment_event(payment, event['type'], payment_intent)
+            return True
+    
+    # A failed payment never queued anything, so there's nothing to wait for
+    return event['type'] != 'payment_intent.succeeded'
+
+def apply_payment_event(payment, event_type, payment_intent):
+    if payment.status == 'succeeded':
+        return
+    
+    queue_item = QueueItem.objects.using(payment._state.db).select_for_update().get(id=payment.queue_item_id)
+    
+    if event_type == 'payment_intent.succeeded':
+        payment.status = 'succeeded'
+        payment.amount = Decimal(payment_intent['amount_received']) / 100
+        payment.save(update_fields=['status', 'amount'])
+        
+        venue = queue_item.venue
+        if queue_item.status in ('pending', 'cancelled') and venue.dedupe_requests:
+            # The song may have been queued while this payment was pending
+            existing_item = merge_request(venue, queue_item.song_id, payment.amount, None, 'succeeded')
+            if existing_item:
+                payment.queue_item = existing_item
+                payment.save(update_fields=['queue_item'])
+                queue_item.status = 'cancelled'  # Its payment now belongs to the merged item
+                queue_item.save(update_fields=['status'])
+                warm_upcoming(venue)
+                return
+        
+        queue_item.payment_status = 'succeeded'
+        queue_item.amount_paid += payment.amount
+        queue_item.is_paid = True
+        if queue_item.status in ('pending', 'cancelled'):
+            # Join the queue at the end of the paid tier. If a request for the same
+            # song lands at this moment, the dedupe constraint fails this event and
+            # Stripe's redelivery merges it instead.
+            queue_item.status = 'queued'
+            queue_item.dedupe = venue.dedupe_requests
+            queue_item.position = QueueItem.tail_position(venue, True)
+        queue_item.save(update_fields=['payment_status', 'amount_paid', 'is_paid', 'status', 'dedupe', 'position'])
+        
+        if queue_item.status == 'queued':
+            warm_upcoming(queue_item.venue)
+    else:
+        payment.status = 'failed'
+        payment.save(update_fields=['status'])
+        
+        # Failed or abandoned payments never reach the queue
+        queue_item.payment_status = 'failed'
+        if queue_item.status == 'pending':
+            queue_item.status = 'cancelled'
+        queue_item.save(update_fields=['payment_status', 'status'])
+
+def advance_queue(venue, finished_status='played'):
+    """
+    Finish the current song with `finished_status` and start the next queued one.
+    Returns the CurrentlyPlaying row and the new queue item (None if the queue is empty).
+    """
+    # Mark current song as finished
+    try:
+        currently_playing = CurrentlyPlaying.objects.for_venue(venue).get()
         if currently_playing.queue_item:
-            currently_playing.queue_item.status = 'played'
+            currently_playing.queue_item.status = finished_status
             currently_playing.queue_item.save()
     except CurrentlyPlaying.DoesNotExist:
         currently_playing = CurrentlyPlaying.objects.create(venue=venue)
     
     # Get next song from queue
-    next_queue_item = QueueItem.objects.filter(
-        venue=venue,
+    next_queue_item = QueueItem.objects.for_venue(venue).filter(
         status='queued'
-    ).order_by('-is_paid', 'queued_at').first()
+    ).order_by('-is_paid', 'position').first()
     
     if next_queue_item:
         next_queue_item.status = 'playing'
@@ -158,7 +387,195 @@ def next_song(request, venue_id):
         currently_playing.queue_item = None
         currently_playing.save()
     
+    # Start warming the following tracks as soon as they reach the top
+    warm_upcoming(venue)
+    
+    return currently_playing, next_queue_item
+
+@api_view(['POST'])
+def next_song(request, venue_id):
+    """
+    Move to the next song in queue (for venue staff/admin use)
+    """
+    venue = get_object_or_404(Venue, id=venue_id)
+    currently_playing, next_queue_item = advance_queue(venue)
+    
     return Response({
         'message': 'Moved to next song',
         'currently_playing': CurrentlyPlayingSerializer(currently_playing).data if next_queue_item else None
     })
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def skip_song(request, venue_id, item_id):
+    """
+    Skip a queued or playing song (for venue staff/admin use)
+    """
+    venue = get_object_or_404(Venue, id=venue_id)
+    queue_item = get_object_or_404(QueueItem.objects.for_venue(venue), id=item_id, status__in=['queued', 'playing'])
+    
+    if queue_item.status == 'playing':
+        currently_playing, next_queue_item = advance_queue(venue, finished_status='skipped')
+        return Response({
+            'message': 'Skipped current song',
+            'currently_playing': CurrentlyPlayingSerializer(currently_playing).data if next_queue_item else None
+        })
+    
+    queue_item.status = 'skipped'
+    queue_item.save(update_fields=['status'])
+    warm_upcoming(venue)
+    
+    return Response({
+        'message': 'Song skipped',
+        'queue_item': QueueItemSerializer(queue_item).data
+    })
+
+@api_view(['DELETE'])
+@permission_classes([IsAdminUser])
+def remove_from_queue(request, venue_id, item_id):
+    """
+    Remove a free song from the queue (for venue staff/admin use).
+    Paid songs keep their payment record and have to be skipped instead.
+    """
+    venue = get_object_or_404(Venue, id=venue_id)
+    queue_item = get_object_or_404(QueueItem.objects.for_venue(venue), id=item_id, status='queued')
+    
+    if queue_item.is_paid:
+        return Response({
+            'error': 'Paid songs cannot be removed, skip them instead'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    queue_item.delete()
+    warm_upcoming(venue)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def move_in_queue(request, venue_id, item_id):
+    """
+    Move a queued song to a new position (for venue staff/admin use).
+    Songs stay within their paid/free tier, and only the moved row is updated.
+    """
+    venue = get_object_or_404(Venue, id=venue_id)
+    queue_item = get_object_or_404(QueueItem.objects.for_venue(venue), id=item_id, status='queued')
+    serializer = MoveQueueItemSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    queued = QueueItem.objects.for_venue(venue).filter(status='queued')
+    tier = queued.filter(is_paid=queue_item.is_paid).exclude(id=queue_item.id).order_by('position', 'id')
+    
+    # Target index within the item's own tier; free songs can't move above paid ones
+    index = serializer.validated_data['position']
+    if not queue_item.is_paid:
+        index -= queued.filter(is_paid=True).count()
+    index = max(index, 0)
+    
+    if index == 0:
+        before = None
+        after = tier.values_list('position', flat=True).first()
+    else:
+        neighbours = list(tier.values_list('position', flat=True)[index - 1:index + 1])
+        if not neighbours:
+            # Past the end of the tier
+            neighbours = [tier.order_by('-position').values_list('position', flat=True).first()]
+        before = neighbours[0]
+        after = neighbours[1] if len(neighbours) > 1 else None
+    
+    if before is not None and after is not None and before >= after:
+        # Neighbours share a rank (e.g. appended in the same microsecond),
+        # so there's nothing between them: re-rank the whole tier instead
+        rerank_tier(venue, tier, queue_item, index)
+    else:
+        if after is not None:
+            queue_item.position = rank_between(before, after)
+        elif before is not None:
+            queue_item.position = rank_after(before)
+        queue_item.save(update_fields=['position'])
+    
+    # The moved song may now be in the top few that get warmed
+    warm_upcoming(venue)
+    
+    return Response({
+        'message': 'Song moved',
+        'queue_item': QueueItemSerializer(queue_item).data
+    })
+
+def rerank_tier(venue, tier, queue_item, index):
+    """
+    Give every item in the tier a fresh rank, with `queue_item` at `index`
+    """
+    with transaction.atomic(using=shard_for_venue(venue)):
+        items = list(tier.select_for_update())
+        items.insert(index, queue_item)
+        start = min(item.queued_at for item in items)
+        for item, rank in zip(items, spread_ranks(len(items), start)):
+            item.position = rank
+        QueueItem.objects.for_venue(venue).bulk_update(items, ['position'])
+
+@api_view(['GET'])
+def upcoming_songs(request, venue_id):
+    """
+    Next N queued songs with preview URLs, for the venue player to preload
+    """
+    from venues.freesound_service import freesound_sound_id
+    
+    venue = get_object_or_404(Venue, id=venue_id)
+    
+    try:
+        count = min(int(request.GET.get('n', settings.PREFETCH_UPCOMING_COUNT)), 10)
+    except ValueError:
+        return Response({'error': 'Query parameter "n" must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    items = list(upcoming_items(venue, max(count, 1)))
+    warm_upcoming(venue, items)
+    
+    upcoming = []
+    for item in items:
+        sound_id = freesound_sound_id(item.song.external_id)
+        upcoming.append({
+            'queue_item': QueueItemSerializer(item).data,
+            'preview_url': reverse('song-preview', args=[sound_id]) if sound_id else None
+        })
+    
+    return Response({
+        'venue_id': venue_id,
+        'upcoming': upcoming
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def queue_overview(request):
+    """
+    Queue totals for every venue, gathered from all shards in parallel (for admin use)
+    """
+    def shard_totals(shard):
+        return list(
+            QueueItem.objects.using(shard).filter(status='queued').order_by().values('venue_id').annotate(
+                queued=Count('id'),
+                paid=Count('id', filter=Q(is_paid=True)),
+                amount_paid=Sum('amount_paid', filter=Q(payment_status='succeeded'))
+            )
+        )
+    
+    totals = fan_out(shard_totals)
+    venue_names = dict(Venue.objects.values_list('id', 'name'))
+    
+    venues = []
+    for shard, rows in totals.items():
+        for row in rows:
+            venues.append({
+                'venue_id': row['venue_id'],
+                'venue_name': venue_names.get(row['venue_id']),
+                'shard': shard,
+                'queued': row['queued'],
+                'paid': row['paid'],
+                'amount_paid': row['amount_paid'] or Decimal('0.00')
+            })
+    venues.sort(key=lambda venue: venue['venue_id'])
+    
+    return Response({
+        'shards': list(totals),
+        'venues': venues
+    })
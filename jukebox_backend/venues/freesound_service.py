@@ -1,9 +1,38 @@
+import time
+
 import requests
 from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
 import logging
 
 logger = logging.getLogger(__name__)
 
+def pick_preview_url(previews):
+    """
+    Use high-quality preview if available
+    """
+    for preview_format in ('preview-hq-mp3', 'preview-lq-mp3', 'preview-hq-ogg', 'preview-lq-ogg'):
+        if previews.get(preview_format):
+            return previews[preview_format]
+    return None
+
+def freesound_sound_id(external_id):
+    """
+    Extract the numeric Freesound id from an external id ("123" or "freesound_123").
+    Returns None for ids that don't belong to Freesound (e.g. mock songs).
+    """
+    sound_id = str(external_id)
+    if sound_id.startswith('freesound_'):
+        sound_id = sound_id[len('freesound_'):]
+    return sound_id if sound_id.isdigit() else None
+
+def was_searched(sound_id):
+    """
+    Whether a sound came back in a recent search, so it's fine to proxy its preview
+    """
+    return cache.get(f"freesound:searched:{sound_id}") is not None
+
 class FreesoundService:
     """
     Service class for interacting with Freesound API
@@ -15,12 +44,14 @@ class FreesoundService:
         self.client_id = settings.FREESOUND_CLIENT_ID
         self.client_secret = settings.FREESOUND_CLIENT_SECRET
         self.access_token = None
+        self.token_expires_at = 0
     
     def get_access_token(self):
         """
-        Get access token using client credentials flow for Freesound
+        Get access token using client credentials flow for Freesound.
+        The token is reused until shortly before it expires.
         """
-        if self.access_token:
+        if self.access_token and time.monotonic() < self.token_expires_at:
             return self.access_token
             
         # Freesound uses a specific endpoint for client credentials
@@ -37,11 +68,13 @@ class FreesoundService:
         }
         
         try:
-            response = requests.post(token_url, data=data, headers=headers)
+            response = requests.post(token_url, data=data, headers=headers, timeout=settings.PREVIEW_FETCH_TIMEOUT)
             
             if response.status_code == 200:
                 token_data = response.json()
                 self.access_token = token_data.get('access_token')
+                # Refresh a minute early so in-flight requests don't carry a stale token
+                self.token_expires_at = time.monotonic() + int(token_data.get('expires_in', 3600)) - 60
                 logger.info("Successfully obtained Freesound access token")
                 return self.access_token
             else:
@@ -76,6 +109,10 @@ class FreesoundService:
             
             if response.status_code == 200:
                 data = response.json()
+                cache.set_many(
+                    {f"freesound:searched:{sound.get('id')}": True for sound in data.get('results', [])},
+                    settings.FREESOUND_CACHE_TIMEOUT
+                )
                 return self._format_search_results(data)
             else:
                 logger.error(f"Freesound search failed: {response.status_code} - {response.text}")
@@ -88,29 +125,78 @@ class FreesoundService:
     def get_sound_details(self, sound_id):
         """
         Get detailed information about a specific sound
+        Results are cached so warmed sounds don't hit Freesound again
         """
-        token = self.get_access_token()
-        if not token:
-            return None
-            
+        cache_key = f"freesound:sound:{sound_id}"
+        details = cache.get(cache_key)
+        if details is not None:
+            return details
+        
         sound_url = f"{self.base_url}/sounds/{sound_id}/"
         
         params = {
             'fields': 'id,name,description,username,duration,previews,download,license,tags',
         }
         
-        headers = {
-            'Authorization': f'Bearer {token}'
+        try:
+            for attempt in range(2):
+                token = self.get_access_token()
+                if not token:
+                    return None
+                
+                headers = {
+                    'Authorization': f'Bearer {token}'
+                }
+                
+                response = requests.get(sound_url, params=params, headers=headers, timeout=settings.PREVIEW_FETCH_TIMEOUT)
+                if response.status_code != 401:
+                    break
+                # Token revoked or expired early, get a new one and retry once
+                self.access_token = None
+            response.raise_for_status()
+            
+            details = response.json()
+            cache.set(cache_key, details, settings.FREESOUND_CACHE_TIMEOUT)
+            return details
+            
+        except requests.RequestException as e:
+            logger.error(f"Error getting sound details from Freesound: {e}")
+            return None
+    
+    def get_preview_url(self, sound_id):
+        """
+        Look up the best preview URL for a sound, authenticating like search does
+        """
+        cache_key = f"freesound:preview:{sound_id}"
+        preview_url = cache.get(cache_key)
+        if preview_url is not None:
+            return preview_url
+        
+        details = cache.get(f"freesound:sound:{sound_id}")
+        if details is not None:
+            return pick_preview_url(details.get('previews', {}))
+        
+        if not self.client_id:
+            return None
+        
+        sound_url = f"{self.base_url}/sounds/{sound_id}/"
+        
+        params = {
+            'fields': 'id,previews',
+            'token': self.client_id
         }
         
         try:
-            response = requests.get(sound_url, params=params, headers=headers)
+            response = requests.get(sound_url, params=params, timeout=settings.PREVIEW_FETCH_TIMEOUT)
             response.raise_for_status()
             
-            return response.json()
+            preview_url = pick_preview_url(response.json().get('previews', {}))
+            if preview_url:
+                cache.set(cache_key, preview_url, settings.FREESOUND_CACHE_TIMEOUT)
+            return preview_url
             
         except requests.RequestException as e:
-            logger.error(f"Error getting sound details from Freesound: {e}")
+            logger.error(f"Error getting preview URL from Freesound: {e}")
             return None
     
     def _format_search_results(self, freesound_data):
@@ -120,18 +206,7 @@ class FreesoundService:
         results = []
         
         for sound in freesound_data.get('results', []):
-            # Use high-quality preview if available
-            preview_url = None
-            previews = sound.get('previews', {})
-            
-            if previews.get('preview-hq-mp3'):
-                preview_url = previews['preview-hq-mp3']
-            elif previews.get('preview-lq-mp3'):
-                preview_url = previews['preview-lq-mp3']
-            elif previews.get('preview-hq-ogg'):
-                preview_url = previews['preview-hq-ogg']
-            elif previews.get('preview-lq-ogg'):
-                preview_url = previews['preview-lq-ogg']
+            preview_url = pick_preview_url(sound.get('previews', {}))
             
             formatted_sound = {
                 'id': f"freesound_{sound.get('id')}",
@@ -139,6 +214,7 @@ class FreesoundService:
                 'artist': sound.get('username', 'Unknown Artist'),
                 'duration': int(float(sound.get('duration', 0))),
                 'preview_url': preview_url,
+                'cached_preview_url': reverse('song-preview', args=[sound.get('id')]) if preview_url else None,
                 'download_url': sound.get('download'),
                 'license': sound.get('license', 'Unknown License'),
                 'description': sound.get('description', '')[:200] + '...' if sound.get('description', '') else '',
@@ -167,6 +243,7 @@ class FreesoundService:
                     'artist': f'Artist {i}',
                     'duration': 180 + i * 15,
                     'preview_url': None,
+                    'cached_preview_url': None,
                     'download_url': None,
                     'license': 'Creative Commons',
                     'description': f'Mock sound for testing - searched for "{query}"',
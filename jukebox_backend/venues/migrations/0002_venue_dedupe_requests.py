@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('venues', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venue',
+            name='dedupe_requests',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.23 on 2026-10-19 17:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def store_current_shards(apps, schema_editor):
+    """
+    Queue rows were all on 'default' before venues had a shard, so record that
+    """
+    Venue = apps.get_model('venues', 'Venue')
+    connection = schema_editor.connection
+    venues = Venue.objects.using(connection.alias)
+    if not venues.exists():
+        return
+
+    if 'default' not in settings.QUEUE_SHARDS:
+        queue_table = 'music_queue_queueitem'
+        if queue_table in connection.introspection.table_names():
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT 1 FROM {connection.ops.quote_name(queue_table)} LIMIT 1')
+                has_queue_rows = cursor.fetchone() is not None
+            if has_queue_rows:
+                raise RuntimeError(
+                    "Existing queue rows are on 'default', which is not in QUEUE_SHARDS. "
+                    "Add 'default' to QUEUE_SHARDS before migrating."
+                )
+        # No queue rows to keep; venues get a shard on first use
+        return
+
+    venues.update(queue_shard='default')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('venues', '0002_venue_dedupe_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venue',
+            name='queue_shard',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(store_current_shards, migrations.RunPython.noop),
+    ]
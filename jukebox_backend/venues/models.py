@@ -4,6 +4,8 @@ class Venue(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     is_active = models.BooleanField(default=True)
+    dedupe_requests = models.BooleanField(default=False)  # Merge repeat requests for a queued song
+    queue_shard = models.CharField(max_length=100, blank=True, default='')  # Database alias for queue rows, set on creation
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
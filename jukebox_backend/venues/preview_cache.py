@@ -0,0 +1,224 @@
+import logging
+import mimetypes
+import mmap
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+class PreviewCache:
+    """
+    Size-bounded LRU cache of preview audio files on local disk.
+    Files are named after the Freesound sound id and recency is kept in file
+    mtimes. The directory itself is the index, so every worker sharing it
+    evicts against the same total and the cap holds across processes.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _cached_files(self):
+        # Dotfiles are downloads still in progress
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.startswith('.'):
+                yield entry
+
+    def _touch(self, path):
+        # Explicit timestamps, file system clocks are too coarse to order back-to-back uses
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def get(self, sound_id):
+        """
+        Return the cached file path for a sound, or None on a miss
+        """
+        for path in self.cache_dir.glob(f"{sound_id}.*"):
+            try:
+                self._touch(path)
+            except FileNotFoundError:
+                # Evicted by another worker sharing the directory
+                return None
+            return path
+        return None
+
+    def fetch(self, sound_id, url):
+        """
+        Download a preview from upstream into the cache and return its path.
+        Returns None if the download fails.
+        """
+        extension = Path(urlparse(url).path).suffix or '.mp3'
+        path = self.cache_dir / f"{sound_id}{extension}"
+
+        try:
+            response = requests.get(url, stream=True, timeout=settings.PREVIEW_FETCH_TIMEOUT)
+            response.raise_for_status()
+
+            # Write to a temp file and rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.', suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as tmp_file:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        tmp_file.write(chunk)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._touch(path)
+
+        except (requests.RequestException, OSError) as e:
+            logger.error(f"Error caching preview for sound {sound_id}: {e}")
+            return None
+
+        with self._lock:
+            self._evict(keep=path)
+
+        return path
+
+    def get_or_fetch(self, sound_id, url_resolver):
+        """
+        Return the cached file, resolving the upstream URL and downloading only on a miss
+        """
+        path = self.get(sound_id)
+        if path is not None:
+            return path
+
+        url = url_resolver(sound_id)
+        if not url:
+            return None
+        return self.fetch(sound_id, url)
+
+    def _evict(self, keep):
+        """
+        Drop least recently used files until the directory fits in max_bytes,
+        never removing `keep` (the file just fetched)
+        """
+        files = []
+        total_bytes = 0
+        for entry in self._cached_files():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, Path(entry.path)))
+            total_bytes += stat.st_size
+
+        for _, size, path in sorted(files):
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            logger.info(f"Evicted cached preview for sound {path.stem}")
+
+
+_preview_cache = None
+_preview_cache_lock = threading.Lock()
+
+def get_preview_cache():
+    global _preview_cache
+    with _preview_cache_lock:
+        if _preview_cache is None:
+            _preview_cache = PreviewCache(settings.PREVIEW_CACHE_DIR, settings.PREVIEW_CACHE_MAX_BYTES)
+    return _preview_cache
+
+
+def parse_range_header(range_header, size):
+    """
+    Parse a single-range "bytes=" header into an inclusive (start, end) tuple.
+    Returns None if the header is missing or malformed (serve the whole file),
+    raises ValueError if the range can't be satisfied.
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+
+    byte_range = range_header[len('bytes='):].strip()
+    if ',' in byte_range or '-' not in byte_range:
+        return None
+
+    start, end = byte_range.split('-', 1)
+    if (start and not start.isdigit()) or (end and not end.isdigit()) or not (start or end):
+        return None
+
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = int(end) if end else size - 1
+
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def stream_mapped_range(f, mapped, start, end, chunk_size=64 * 1024):
+    """
+    Yield bytes start..end (inclusive) of a memory-mapped file in chunks, then close it.
+    Only one chunk is copied out of the page cache at a time.
+    """
+    try:
+        for offset in range(start, end + 1, chunk_size):
+            yield mapped[offset:min(offset + chunk_size, end + 1)]
+    finally:
+        mapped.close()
+        f.close()
+
+
+def serve_cached_file(path, range_header=None):
+    """
+    Serve a cached file, honouring HTTP Range requests.
+    Whole files go out through FileResponse (sendfile where the server supports it),
+    ranges are streamed from a memory map.
+    """
+    content_type = mimetypes.guess_type(str(path))[0] or 'application/octet-stream'
+
+    f = open(path, 'rb')
+    size = os.fstat(f.fileno()).st_size
+    try:
+        byte_range = parse_range_header(range_header, size) if size else None
+    except ValueError:
+        f.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        # FileResponse closes the file once the response is sent
+        response = FileResponse(f, content_type=content_type)
+    else:
+        start, end = byte_range
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            f.close()
+            raise
+        response = StreamingHttpResponse(
+            stream_mapped_range(f, mapped, start, end),
+            content_type=content_type,
+            status=206
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
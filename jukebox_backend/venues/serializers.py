@@ -4,7 +4,7 @@ from .models import Venue, Song
 class VenueSerializer(serializers.ModelSerializer):
     class Meta:
         model = Venue
-        fields = ['id', 'name', 'description', 'is_active', 'created_at']
+        fields = ['id', 'name', 'description', 'is_active', 'dedupe_requests', 'created_at']
 
 class SongSerializer(serializers.ModelSerializer):
     class Meta:
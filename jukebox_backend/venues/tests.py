@@ -1,3 +1,201 @@
-from django.test import TestCase
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from jukebox_backend.ratelimit import get_store
+from .freesound_service import FreesoundService
+from .models import Song
+from .preview_cache import PreviewCache, parse_range_header, serve_cached_file
+
+def fake_upstream(content):
+    response = mock.Mock()
+    response.iter_content.return_value = [content]
+    return response
+
+class ParseRangeHeaderTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range_header('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range_header('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range_header('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range_header('bytes=990-2000', 1000), (990, 999))
+
+    def test_missing_or_malformed_serves_whole_file(self):
+        self.assertIsNone(parse_range_header(None, 1000))
+        self.assertIsNone(parse_range_header('bytes=abc-', 1000))
+        self.assertIsNone(parse_range_header('bytes=0-1,5-6', 1000))
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(ValueError):
+            parse_range_header('bytes=1000-', 1000)
+
+class PreviewCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    @mock.patch('venues.preview_cache.requests.get')
+    def test_evicts_least_recently_used(self, mock_get):
+        mock_get.return_value = fake_upstream(b'x' * 10)
+        cache = PreviewCache(self.tmp_dir.name, max_bytes=25)
+
+        cache.fetch('1', 'https://cdn.freesound.org/previews/1.mp3')
+        cache.fetch('2', 'https://cdn.freesound.org/previews/2.mp3')
+        cache.get('1')
+        cache.fetch('3', 'https://cdn.freesound.org/previews/3.mp3')
+
+        self.assertIsNotNone(cache.get('1'))
+        self.assertIsNone(cache.get('2'))
+        self.assertIsNotNone(cache.get('3'))
+
+    @mock.patch('venues.preview_cache.requests.get')
+    def test_workers_sharing_directory_respect_one_cap(self, mock_get):
+        mock_get.return_value = fake_upstream(b'x' * 10)
+        workers = [PreviewCache(self.tmp_dir.name, max_bytes=25) for _ in range(3)]
+
+        for sound_id, worker in enumerate(workers * 2):
+            worker.fetch(str(sound_id), f'https://cdn.freesound.org/previews/{sound_id}.mp3')
+
+        self.assertLessEqual(sum(path.stat().st_size for path in Path(self.tmp_dir.name).iterdir()), 25)
+        self.assertIsNotNone(workers[0].get('5'))
+
+    @mock.patch('venues.preview_cache.requests.get')
+    def test_hit_skips_upstream(self, mock_get):
+        mock_get.return_value = fake_upstream(b'audio')
+        cache = PreviewCache(self.tmp_dir.name, max_bytes=1024)
+        resolver = mock.Mock(return_value='https://cdn.freesound.org/previews/1.mp3')
+
+        cache.get_or_fetch('1', resolver)
+        cache.get_or_fetch('1', resolver)
+
+        self.assertEqual(resolver.call_count, 1)
+        self.assertEqual(mock_get.call_count, 1)
+
+    def test_serves_byte_range(self):
+        path = Path(self.tmp_dir.name) / '1.mp3'
+        path.write_bytes(b'0123456789')
+
+        response = serve_cached_file(path, 'bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+
+        response = serve_cached_file(path, 'bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_streams_whole_file_in_chunks(self):
+        path = Path(self.tmp_dir.name) / '1.mp3'
+        path.write_bytes(b'0123456789' * 20000)
+
+        response = serve_cached_file(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Length'], '200000')
+        self.assertEqual(b''.join(response.streaming_content), path.read_bytes())
+        response.close()
+
+        response = serve_cached_file(path, 'bytes=65530-131080')
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(b''.join(chunks), path.read_bytes()[65530:131081])
+
+def fake_response(status_code, data=None):
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = data or {}
+    return response
+
+@override_settings(FREESOUND_CLIENT_ID='client', FREESOUND_CLIENT_SECRET='secret')
+class FreesoundTokenTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('venues.freesound_service.time.monotonic')
+    @mock.patch('venues.freesound_service.requests.post')
+    def test_token_refreshed_after_expiry(self, mock_post, mock_monotonic):
+        mock_post.side_effect = [
+            fake_response(200, {'access_token': 'first', 'expires_in': 3600}),
+            fake_response(200, {'access_token': 'second', 'expires_in': 3600}),
+        ]
+        service = FreesoundService()
+
+        mock_monotonic.return_value = 0
+        self.assertEqual(service.get_access_token(), 'first')
+        mock_monotonic.return_value = 3000
+        self.assertEqual(service.get_access_token(), 'first')
+        mock_monotonic.return_value = 3590
+        self.assertEqual(service.get_access_token(), 'second')
+
+    @mock.patch('venues.freesound_service.requests.get')
+    @mock.patch('venues.freesound_service.requests.post')
+    def test_sound_details_retry_once_on_401(self, mock_post, mock_get):
+        mock_post.side_effect = [
+            fake_response(200, {'access_token': 'revoked', 'expires_in': 3600}),
+            fake_response(200, {'access_token': 'fresh', 'expires_in': 3600}),
+        ]
+        mock_get.side_effect = [fake_response(401), fake_response(200, {'id': 1})]
+
+        details = FreesoundService().get_sound_details(1)
+
+        self.assertEqual(details, {'id': 1})
+        self.assertEqual(mock_get.call_args.kwargs['headers']['Authorization'], 'Bearer fresh')
+
+    @override_settings(PREVIEW_FETCH_TIMEOUT=7)
+    @mock.patch('venues.freesound_service.requests.get')
+    @mock.patch('venues.freesound_service.requests.post')
+    def test_background_lookups_time_out(self, mock_post, mock_get):
+        mock_post.return_value = fake_response(200, {'access_token': 'token', 'expires_in': 3600})
+        mock_get.return_value = fake_response(200, {'id': 1})
+
+        FreesoundService().get_sound_details(1)
+
+        self.assertEqual(mock_post.call_args.kwargs['timeout'], 7)
+        self.assertEqual(mock_get.call_args.kwargs['timeout'], 7)
+
+@override_settings(RATE_LIMITS={'preview_fetch': {'client': {'capacity': 1, 'refill_rate': 0.01}}})
+class SongPreviewTests(TestCase):
+    def setUp(self):
+        get_store().clear()
+        cache.clear()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.addCleanup(mock.patch.stopall)
+        preview_cache = PreviewCache(self.tmp_dir.name, max_bytes=1024)
+        mock.patch('venues.preview_cache.get_preview_cache', return_value=preview_cache).start()
+        self.fetch = mock.patch.object(preview_cache, 'fetch', return_value=None).start()
+
+    @mock.patch('venues.freesound_service.FreesoundService.get_preview_url')
+    def test_unknown_sound_is_not_proxied(self, mock_preview_url):
+        response = self.client.get('/api/songs/123/preview/')
+
+        self.assertEqual(response.status_code, 404)
+        mock_preview_url.assert_not_called()
+
+    @mock.patch('venues.freesound_service.FreesoundService.get_preview_url', return_value='https://cdn.freesound.org/previews/1.mp3')
+    def test_misses_are_rate_limited(self, mock_preview_url):
+        Song.objects.create(title='Rain', artist='Field', duration=60, external_id='freesound_123')
+        cache.set('freesound:searched:456', True)
+
+        self.assertEqual(self.client.get('/api/songs/123/preview/').status_code, 502)
+        response = self.client.get('/api/songs/456/preview/')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) > 0)
+        self.assertEqual(self.fetch.call_count, 1)
+
+    @mock.patch('venues.freesound_service.FreesoundService.get_preview_url', return_value='https://cdn.freesound.org/previews/1.mp3')
+    def test_file_evicted_after_lookup_is_refetched(self, mock_preview_url):
+        Song.objects.create(title='Rain', artist='Field', duration=60, external_id='freesound_123')
+        fetched = Path(self.tmp_dir.name) / '123.mp3'
+        fetched.write_bytes(b'audio')
+        self.fetch.return_value = fetched
+        # Another worker removes the file between get() and open()
+        stale = Path(self.tmp_dir.name) / 'evicted.mp3'
+        mock.patch('venues.preview_cache.PreviewCache.get', side_effect=[stale, None]).start()
+
+        response = self.client.get('/api/songs/123/preview/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'audio')
+        self.assertEqual(self.fetch.call_count, 1)
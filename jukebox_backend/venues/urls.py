@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import VenueListView, VenueDetailView, search_songs
+from .views import VenueListView, VenueDetailView, search_songs, song_preview
 
 urlpatterns = [
     path('venues/', VenueListView.as_view(), name='venue-list'),
     path('venues/<int:pk>/', VenueDetailView.as_view(), name='venue-detail'),
     path('songs/search/', search_songs, name='search-songs'),
+    path('songs/<str:sound_id>/preview/', song_preview, name='song-preview'),
 ]
\ No newline at end of file
@@ -1,8 +1,14 @@
+import math
+
 from rest_framework import generics
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
 from django.conf import settings
-import requests
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from jukebox_backend.integrations import get_freesound
+from jukebox_backend.ratelimit import check_rate_limit, rate_limit
+from jukebox_backend.renderers import COMPACT_RENDERER_CLASSES
 from .models import Venue, Song
 from .serializers import VenueSerializer, SongSerializer
 
@@ -15,20 +21,70 @@ class VenueDetailView(generics.RetrieveAPIView):
     serializer_class = VenueSerializer
 
 @api_view(['GET'])
+@renderer_classes(COMPACT_RENDERER_CLASSES)
+@rate_limit('search')
 def search_songs(request):
     query = request.GET.get('q', '')
     if not query:
         return Response({'error': 'Query parameter "q" is required'}, status=400)
     
-    # Import here to avoid circular imports
-    from .freesound_service import FreesoundService
-    
     # Get pagination parameters
     page = int(request.GET.get('page', 1))
     page_size = int(request.GET.get('page_size', 15))
     
     # Search using Freesound API
-    freesound = FreesoundService()
-    results = freesound.search_sounds(query, page=page, page_size=page_size)
+    results = get_freesound().search_sounds(query, page=page, page_size=page_size)
     
     return Response(results)
+
+@require_GET
+def song_preview(request, sound_id):
+    """
+    Serve a Freesound preview from the local disk cache, fetching it from upstream on a miss.
+    Supports Range requests so players can seek without re-downloading.
+    """
+    from .freesound_service import freesound_sound_id, was_searched
+    from .preview_cache import get_preview_cache, serve_cached_file
+    
+    sound_id = freesound_sound_id(sound_id)
+    if not sound_id:
+        return JsonResponse({'error': 'Unknown sound id'}, status=404)
+    
+    range_header = request.META.get('HTTP_RANGE')
+    preview_cache = get_preview_cache()
+    path = preview_cache.get(sound_id)
+    if path is not None:
+        try:
+            return serve_cached_file(path, range_header)
+        except FileNotFoundError:
+            # Evicted by another worker since get(); treat it as a miss
+            pass
+    
+    # Misses cost a Freesound lookup and download, so only fetch sounds patrons
+    # have searched for or queued, within the client's fetch budget
+    known = was_searched(sound_id) or Song.objects.filter(
+        external_id__in=[sound_id, f'freesound_{sound_id}']
+    ).exists()
+    if not known:
+        return JsonResponse({'error': 'Unknown sound id'}, status=404)
+    
+    if settings.RATE_LIMIT_ENABLED:
+        retry_after = check_rate_limit(request, 'preview_fetch')
+        if retry_after:
+            retry_after = math.ceil(retry_after)
+            response = JsonResponse({
+                'error': 'Too many requests. Please try again later.',
+                'retry_after': retry_after
+            }, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+    
+    path = preview_cache.get_or_fetch(sound_id, get_freesound().get_preview_url)
+    if path is None:
+        return JsonResponse({'error': 'Preview not available'}, status=502)
+    
+    try:
+        return serve_cached_file(path, range_header)
+    except FileNotFoundError:
+        # Evicted again before we could open it
+        return JsonResponse({'error': 'Preview not available'}, status=502)